@@ -0,0 +1,407 @@
+import argparse
+import copy
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from urllib.request import urlopen
+
+import crawl_state
+import crawler
+import fetcher
+import http_client
+import pipeline
+import search
+import sources
+import storage
+
+# 離線爬蟲基準測試：python bench.py --pages 5 --latency 0.05 --error-rate 0.01 --output bench.json
+#
+# 在子行程中啟動本機 HTTP 伺服器提供兩個來源的列表與內文頁（可設定延遲與錯誤率），
+# 爬蟲寫入記憶體中的資料庫替身（或以 --db sqlite 寫入暫存的 SQLite 檔案），不會連到實際網站或 MySQL。每個來源以 crawl_source 完整跑一次，
+# 記錄每秒頁數、每秒筆數、各階段每筆的 p50 / p99 延遲與 RSS 峰值，結果寫成 JSON 以便比較不同版本。
+#
+# 列表與內文頁預設為自動產生的頁面（列表與實際網站相同，由新到舊排列）；以 --record 下載實際網站的列表頁
+# （前 --pages 頁，連結改指向本機）與內文頁到 --fixtures 目錄後，改為提供這些頁面，內文頁輪流使用。
+# 伺服器注入的 503 多數會被 http_client 的重試吸收，結果中另外記錄注入次數與爬蟲實際收到的次數。
+#
+# 另外測量進入點的冷啟動時間：在新的直譯器中匯入 main、new_gui 與 crawler，記錄整個行程與匯入本身的耗時。
+
+_PARAGRAPH = ('本院監察委員調查發現，相關機關未依規定辦理，核有違失，爰依法提案糾正，'
+              '並函請行政院督促所屬確實檢討改善見復。')
+
+
+# 記憶體中的資料庫替身，可模擬每次查詢的往返延遲
+class MemoryBackend:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.tables = {}
+        self._lock = threading.Lock()
+
+    def _table(self, config, table):
+        return self.tables.setdefault((config.get('database'), table), {})
+
+    def existing_urls(self, config, table, urls):
+        time.sleep(self.latency)
+        with self._lock:
+            rows = self._table(config, table)
+            return {url for url in urls if url in rows}
+
+    def upsert_rows(self, config, table, columns, rows):
+        time.sleep(self.latency)
+        url_pos = list(columns).index('url')
+        with self._lock:
+            stored = self._table(config, table)
+            for row in rows:
+                stored[row[url_pos]] = dict(zip(columns, row))
+        return len(rows)
+
+    def iter_rows(self, config, table, columns, batch_size=10000):
+        with self._lock:
+            rows = list(self._table(config, table).values())
+        for row in rows:
+            yield tuple(row.get(name) for name in columns)
+
+
+def _listing_html(name, page, per_page, total):
+    rows = []
+    for i in range(per_page):
+        item_id = total - (page - 1) * per_page - i
+        if item_id <= 0:
+            break
+        date = time.strftime('%Y-%m-%d', time.gmtime(1600000000 + item_id * 3600 * 12))  # 編號越大越新
+        if name == 'cy':
+            rows.append(f'<tr><td><span>{date}</span></td>'
+                        f'<td><a href="cy/item/{item_id}">監察院新聞稿 {item_id}</a></td></tr>')
+        else:
+            year, month, day = date.split('-')
+            rows.append(f'<div class="area-essay message"><a href="nhrc/item/{item_id}">'
+                        f'<div class="caption"><span>人權會新聞稿 {item_id}</span></div></a>'
+                        f'<div class="label"><ul><li><span><i class="mark">{int(year) - 1911}-{month}-{day}'
+                        '</i></span></li></ul></div></div>')
+    body = f'<table><tbody>{"".join(rows)}</tbody></table>' if name == 'cy' else ''.join(rows)
+    return f'<html><body>{body}</body></html>'
+
+
+def _detail_html(name, item_id):
+    rng = random.Random(item_id)
+    paragraphs = ''.join(f'<p>{_PARAGRAPH * rng.randint(2, 6)}（第 {n} 段）</p>' for n in range(rng.randint(5, 15)))
+    css = 'area-essay page-caption-p' if name == 'cy' else 'area-essay'
+    return (f'<html><head><script>var x = 1;</script></head><body><div class="header">導覽</div>'
+            f'<div class="{css}">{paragraphs}</div><div class="footer">頁尾</div></body></html>')
+
+
+# 讀取目錄中的 .html 檔，依檔名排序
+def _read_pages(path):
+    pages = []
+    if os.path.isdir(path):
+        for filename in sorted(os.listdir(path)):
+            if filename.endswith('.html'):
+                with open(os.path.join(path, filename), encoding='utf-8') as f:
+                    pages.append(f.read())
+    return pages
+
+
+# 回傳 ({來源: 內文頁清單}, {來源: 列表頁清單})
+def _load_fixtures(directory):
+    details, listings = {}, {}
+    for name in sources.SOURCES:
+        if directory:
+            details[name] = _read_pages(os.path.join(directory, name))
+            listings[name] = _read_pages(os.path.join(directory, name, 'listing'))
+    return details, listings
+
+
+# 子行程：本機測試網站
+def _serve(conn, per_page, total, latency, error_rate, fixtures_dir):
+    details, listings = _load_fixtures(fixtures_dir)
+    rng = random.Random(0)
+    lock = threading.Lock()
+    stats = {'requests': 0, 'injected_errors': 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # 標頭與內容分兩次寫出，keep-alive 連線上若不關閉 Nagle 會與延遲 ACK 互相等待約 40 ms
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            segments = parts.path.strip('/').split('/')
+            if parts.path == '/_stats':
+                with lock:
+                    return self._send(json.dumps(stats).encode('utf-8'), 200, 'application/json')
+            with lock:
+                delay = latency * rng.uniform(0.5, 1.5)
+                fail = rng.random() < error_rate
+                stats['requests'] += 1
+                stats['injected_errors'] += fail
+            time.sleep(delay)
+            if fail:
+                body, status = b'injected error', 503
+            elif len(segments) == 2 and segments[1] == 'list':
+                page = int(parse_qs(parts.query).get('page', ['1'])[0])
+                recorded = listings.get(segments[0])
+                if recorded:
+                    html = recorded[page - 1] if page <= len(recorded) else '<html><body></body></html>'
+                else:
+                    html = _listing_html(segments[0], page, per_page, total)
+                body, status = html.encode('utf-8'), 200
+            elif len(segments) == 3 and segments[1] == 'item':
+                pages = details.get(segments[0])
+                html = pages[int(segments[2]) % len(pages)] if pages else _detail_html(segments[0], int(segments[2]))
+                body, status = html.encode('utf-8'), 200
+            else:
+                body, status = b'not found', 404
+            self._send(body, status)
+
+        def _send(self, body, status, content_type='text/html; charset=utf-8'):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    conn.send(server.server_address[1])
+    server.serve_forever()
+
+
+# 以實際網站的前 pages 頁列表與其中前 count 篇內文頁作為測試資料；
+# 列表中的連結改為本機網址 <來源>/item/<編號>，編號超過 count 的連結由伺服器輪流提供已下載的內文頁
+def record(directory, count, pages=1):
+    for source in sources.SOURCES.values():
+        path = os.path.join(directory, source.name)
+        os.makedirs(os.path.join(path, 'listing'), exist_ok=True)
+        n = 0
+        for page, listing_url in enumerate(source.listing_urls(pages), 1):
+            response = http_client.get(listing_url)
+            response.raise_for_status()
+            html = response.text
+            for _, _, url in source.parse_listing(html):
+                href = url[len(source.link_prefix):]
+                for quote in ('"', "'"):
+                    html = html.replace(f'href={quote}{href}{quote}', f'href="{source.name}/item/{n}"')
+                if n < count:
+                    response = http_client.get(url)
+                    response.raise_for_status()
+                    with open(os.path.join(path, f"{n:04d}.html"), 'w', encoding='utf-8') as f:
+                        f.write(response.text)
+                n += 1
+            with open(os.path.join(path, 'listing', f"{page:04d}.html"), 'w', encoding='utf-8') as f:
+                f.write(html)
+        print(f"[{source.name}] 已儲存 {pages} 頁列表與 {min(n, count)} 篇內文頁至 {path}")
+
+
+def _server_stats(port):
+    with urlopen(f"http://127.0.0.1:{port}/_stats") as response:
+        return json.load(response)
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(round(q * (len(values) - 1))))] * 1000, 3)
+
+
+def _peak_rss_kb():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    scale = 1 if sys.platform != 'darwin' else 1 / 1024  # macOS 以 bytes 為單位
+    return {'self': int(usage * scale), 'children': int(children * scale)}
+
+
+def _version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# 以本機測試網站爬取一個來源，回傳結果統計；db_path 有值時寫入該 SQLite 檔案而非記憶體資料庫
+def run_source(source, port, pages, run_id, db_path=None):
+    bench_source = copy.copy(source)
+    bench_source.listing_url = f"http://127.0.0.1:{port}/{source.name}/list?page={{}}"
+    bench_source.link_prefix = f"http://127.0.0.1:{port}/"
+    if db_path:
+        config = {'backend': 'sqlite', 'path': f"{db_path}-{run_id}"}
+    else:
+        config = {'backend': 'memory', 'host': 'bench', 'database': f"bench-{run_id}"}
+
+    counters = {}
+    latencies = {}
+    lock = threading.Lock()
+
+    def progress(name, count=1):
+        with lock:
+            counters[name] = counters.get(name, 0) + count
+
+    def listener(pipe_name, stage_name, seconds, count):
+        if pipe_name == source.name:
+            with lock:
+                latencies.setdefault(stage_name, []).extend([seconds / count] * count)
+
+    host = f"127.0.0.1:{port}"
+    server_before = _server_stats(port)
+    seen_before = http_client._requests.value(host=host, status='503')
+    pipeline.add_listener(listener)
+    started = time.perf_counter()
+    failure = None
+    try:
+        # 內文頁失敗由爬蟲逐篇略過並計入 errors；列表頁失敗會中斷此來源，記錄原因後繼續測試其他來源
+        crawler.crawl_source(bench_source, pages, config, log=lambda message: None,
+                             incremental=False, progress=progress)
+    except Exception as err:
+        failure = f"{type(err).__name__}: {err}"
+    finally:
+        pipeline.remove_listener(listener)
+    elapsed = time.perf_counter() - started
+    server_after = _server_stats(port)
+    return {
+        'seconds': round(elapsed, 3),
+        'failure': failure,
+        'pages': counters.get('pages', 0),
+        'items': counters.get('inserted', 0),
+        'errors': counters.get('errors', 0),
+        # 伺服器收到的請求數（含重試）、注入的 503 次數，以及重試用盡後爬蟲仍收到 503 的請求數
+        'server_requests': server_after['requests'] - server_before['requests'],
+        'injected_errors': server_after['injected_errors'] - server_before['injected_errors'],
+        'errors_after_retry': http_client._requests.value(host=host, status='503') - seen_before,
+        'pages_per_second': round(counters.get('pages', 0) / elapsed, 2),
+        'items_per_second': round(counters.get('inserted', 0) / elapsed, 2),
+        'stages': {name: {'count': len(values), 'p50_ms': _percentile(values, 0.5),
+                          'p99_ms': _percentile(values, 0.99)}
+                   for name, values in latencies.items()},
+    }
+
+
+# 在新的直譯器中匯入各模組 repeats 次，回傳整個行程與匯入本身耗時的中位數（毫秒）
+def cold_start(modules, repeats):
+    code = "import time; started = time.perf_counter(); import {}; print(time.perf_counter() - started)"
+    results = {}
+    for module in modules:
+        process, imports = [], []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            completed = subprocess.run([sys.executable, '-c', code.format(module)], capture_output=True, text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__)))
+            if completed.returncode != 0:
+                results[module] = {'error': completed.stderr.strip().splitlines()[-1]}
+                break
+            process.append(time.perf_counter() - started)
+            imports.append(float(completed.stdout.split()[-1]))
+        else:
+            results[module] = {'process_ms_p50': _percentile(process, 0.5), 'import_ms_p50': _percentile(imports, 0.5)}
+    return results
+
+
+# 與先前的結果比較每秒筆數與冷啟動時間，印出變化比例
+def compare(previous_path, results):
+    with open(previous_path, encoding='utf-8') as f:
+        previous = json.load(f)
+    for name, result in results['sources'].items():
+        before = previous.get('sources', {}).get(name)
+        if before and before['items_per_second']:
+            change = result['items_per_second'] / before['items_per_second'] - 1
+            print(f"[{name}] 每秒筆數 {before['items_per_second']} → {result['items_per_second']} ({change:+.1%})")
+    for module, result in results.get('cold_start', {}).items():
+        before = previous.get('cold_start', {}).get(module)
+        if before and before.get('process_ms_p50') and result.get('process_ms_p50'):
+            change = result['process_ms_p50'] / before['process_ms_p50'] - 1
+            print(f"[{module}] 冷啟動 {before['process_ms_p50']} → {result['process_ms_p50']} ms ({change:+.1%})")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='離線爬蟲基準測試')
+    parser.add_argument('--pages', type=int, default=5, help='每個來源爬取的列表頁數')
+    parser.add_argument('--per-page', type=int, default=50, help='每頁列表的筆數')
+    parser.add_argument('--latency', type=float, default=0.02, help='每個請求的平均延遲（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='回應 503 的比例')
+    parser.add_argument('--db-latency', type=float, default=0.001, help='每次資料庫操作的延遲（秒）')
+    parser.add_argument('--db', choices=('memory', 'sqlite'), default='memory',
+                        help='寫入記憶體資料庫替身或暫存目錄中的 SQLite 檔案')
+    parser.add_argument('--source', choices=sorted(sources.SOURCES), action='append',
+                        help='只測試指定來源（預設為全部）')
+    parser.add_argument('--fixtures', help='內文頁測試資料目錄')
+    parser.add_argument('--record', type=int, metavar='N',
+                        help='下載每個來源前 --pages 頁列表與 N 篇實際內文頁到 --fixtures 後結束')
+    parser.add_argument('--cold-start', type=int, default=5, metavar='N',
+                        help='每個進入點測量 N 次冷啟動時間，0 表示不測量')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', help='與先前的結果檔比較')
+    args = parser.parse_args()
+
+    if args.record:
+        if not args.fixtures:
+            parser.error('--record 需指定 --fixtures')
+        record(args.fixtures, args.record, args.pages)
+        sys.exit(0)
+
+    # 狀態檔與索引寫到暫存目錄，不影響正式資料
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    crawl_state.CRAWL_STATE_PATH = os.path.join(workdir, 'crawl_state.json')
+    http_client.HTTP_VALIDATORS_PATH = os.path.join(workdir, 'http_validators.json')
+    search.SEARCH_INDEX_PATH = os.path.join(workdir, 'search_index.db')
+    storage.register_backend('memory', MemoryBackend(args.db_latency))
+
+    parent_conn, child_conn = multiprocessing.Pipe()
+    total = args.pages * args.per_page
+    server = multiprocessing.Process(target=_serve, daemon=True, args=(
+        child_conn, args.per_page, total, args.latency, args.error_rate, args.fixtures))
+    server.start()
+    port = parent_conn.recv()
+
+    results = {
+        'version': _version(),
+        'python': platform.python_version(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'parameters': {name: value for name, value in vars(args).items() if name not in ('output', 'compare')},
+        'settings': {'FETCH_WORKERS': fetcher.FETCH_WORKERS, 'PARSE_WORKERS': crawler.PARSE_WORKERS,
+                     'PARSE_PROCESSES': crawler.PARSE_PROCESSES, 'DB_BATCH_SIZE': crawler.DB_BATCH_SIZE},
+        'sources': {},
+    }
+    try:
+        for run_id, name in enumerate(args.source or sources.SOURCES):
+            result = run_source(sources.SOURCES[name], port, args.pages, run_id,
+                                os.path.join(workdir, 'bench.db') if args.db == 'sqlite' else None)
+            results['sources'][name] = result
+            print(f"[{name}] {result['pages']} 頁 / {result['items']} 筆，{result['seconds']} 秒，"
+                  f"{result['items_per_second']} 筆/秒；注入 503 {result['injected_errors']} 次，"
+                  f"重試後仍失敗 {result['errors_after_retry']} 次，略過 {result['errors']} 篇")
+            if result['failure']:
+                print(f"[{name}] 爬取中斷: {result['failure']}")
+            for stage, stats in result['stages'].items():
+                print(f"    {stage}: p50 {stats['p50_ms']} ms, p99 {stats['p99_ms']} ms")
+    finally:
+        server.terminate()
+        shutil.rmtree(workdir, ignore_errors=True)
+    results['peak_rss_kb'] = _peak_rss_kb()
+    print(f"RSS 峰值: {results['peak_rss_kb']['self']} KB")
+    if args.cold_start:
+        results['cold_start'] = cold_start(('main', 'new_gui', 'crawler'), args.cold_start)
+        for module, result in results['cold_start'].items():
+            if 'error' in result:
+                print(f"[{module}] 冷啟動測量失敗: {result['error']}")
+            else:
+                print(f"[{module}] 冷啟動 {result['process_ms_p50']} ms（匯入 {result['import_ms_p50']} ms）")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"結果已寫入 {args.output}")
+    if args.compare:
+        compare(args.compare, results)
@@ -0,0 +1,264 @@
+import argparse
+import os
+import random
+import re
+import sys
+import threading
+import zlib
+from collections import Counter
+
+import sources
+import storage
+
+# 內文壓縮儲存：設定 BODY_COMPRESSION=zlib 或 zstd 後，新寫入的內文會壓縮存入 <內文欄位>_z（MEDIUMBLOB），
+# 原本的文字欄位留空；讀取時自動解壓縮，未壓縮的舊資料照常讀取。
+#
+# 壓縮時使用以既有新聞稿訓練的共用字典（存於 body_dictionaries），公文中重複的機關名稱與固定用語
+# 不必在每一筆中各自出現一次。zstd 需另外安裝 zstandard 套件。
+#
+#   python body_codec.py --train              # 以現有資料訓練字典
+#   python body_codec.py --convert            # 分批將既有資料轉為壓縮格式
+#   BODY_COMPRESSION= python body_codec.py --convert   # 轉回未壓縮的文字
+BODY_COMPRESSION = os.getenv('BODY_COMPRESSION', '')
+BODY_COMPRESSION_LEVEL = int(os.getenv('BODY_COMPRESSION_LEVEL', '0'))  # 0 表示使用各演算法的預設等級
+# 訓練字典時抽樣的筆數
+BODY_DICT_SAMPLES = int(os.getenv('BODY_DICT_SAMPLES', '2000'))
+
+# 壓縮資料的格式：1 byte 演算法代碼 + 4 bytes 字典編號（0 表示不使用字典）+ 壓縮內容
+_ALGORITHMS = {'zlib': 1, 'zstd': 2}
+_DEFAULT_LEVELS = {'zlib': 9, 'zstd': 19}
+_DICT_SIZES = {'zlib': 32 * 1024, 'zstd': 112 * 1024}  # zlib 的視窗只有 32 KB
+
+_dictionaries = {}
+_current = {}
+_lock = threading.Lock()
+
+
+def _level(algorithm):
+    return BODY_COMPRESSION_LEVEL or _DEFAULT_LEVELS[algorithm]
+
+
+def _dictionary(config, dict_id):
+    key = (storage.config_key(config), dict_id)
+    with _lock:
+        data = _dictionaries.get(key)
+    if data is None:
+        with storage.connection(config) as cnx:
+            cursor = cnx.cursor()
+            cursor.execute("SELECT data FROM body_dictionaries WHERE id = %s", (dict_id,))
+            row = cursor.fetchone()
+            cursor.close()
+        if row is None:
+            raise ValueError(f"找不到壓縮字典 {dict_id}")
+        data = bytes(row[0])
+        with _lock:
+            _dictionaries[key] = data
+    return data
+
+
+# 目前用於壓縮的字典（該演算法最新訓練的一份），尚未訓練時回傳 (0, None)
+def _current_dictionary(config, algorithm):
+    key = (storage.config_key(config), algorithm)
+    with _lock:
+        current = _current.get(key)
+    if current is None:
+        with storage.connection(config) as cnx:
+            cursor = cnx.cursor()
+            cursor.execute("SELECT id, data FROM body_dictionaries WHERE algorithm = %s "
+                           "ORDER BY id DESC LIMIT 1", (algorithm,))
+            row = cursor.fetchone()
+            cursor.close()
+        current = (row[0], bytes(row[1])) if row else (0, None)
+        with _lock:
+            _current[key] = current
+            if row:
+                _dictionaries[(key[0], row[0])] = current[1]
+    return current
+
+
+# 先載入所有尚未快取的字典（並記下各演算法目前的字典）。在持有連線的情況下解壓縮或壓縮前呼叫，
+# 快取未命中時才不會再向連線池借第二條連線；同時進行的讀取數達 DB_POOL_SIZE 時，兩者會互相等待
+def preload(config):
+    prefix = storage.config_key(config)
+    with storage.connection(config) as cnx:
+        cursor = cnx.cursor()
+        cursor.execute("SELECT id, algorithm FROM body_dictionaries ORDER BY id")
+        known = cursor.fetchall()
+        with _lock:
+            missing = [dict_id for dict_id, _ in known if (prefix, dict_id) not in _dictionaries]
+        loaded = []
+        if missing:
+            cursor.execute(f"SELECT id, data FROM body_dictionaries WHERE id IN ({', '.join(['%s'] * len(missing))})",
+                           missing)
+            loaded = cursor.fetchall()
+        cursor.close()
+    with _lock:
+        for dict_id, data in loaded:
+            _dictionaries[(prefix, dict_id)] = bytes(data)
+        for algorithm in _ALGORITHMS:
+            latest = [dict_id for dict_id, name in known if name == algorithm]
+            if (prefix, algorithm) not in _current:
+                _current[(prefix, algorithm)] = (latest[-1], _dictionaries[(prefix, latest[-1])]) if latest else (0, None)
+
+
+def compress(config, text, algorithm=None):
+    algorithm = algorithm or BODY_COMPRESSION
+    dict_id, data = _current_dictionary(config, algorithm)
+    raw = text.encode('utf-8')
+    if algorithm == 'zlib':
+        compressor = zlib.compressobj(_level(algorithm), zlib.DEFLATED, -15, zdict=data) if data else \
+            zlib.compressobj(_level(algorithm), zlib.DEFLATED, -15)
+        payload = compressor.compress(raw) + compressor.flush()
+    elif algorithm == 'zstd':
+        import zstandard
+        dict_data = zstandard.ZstdCompressionDict(data) if data else None
+        payload = zstandard.ZstdCompressor(level=_level(algorithm), dict_data=dict_data).compress(raw)
+    else:
+        raise ValueError(f"未知的壓縮方式: {algorithm}")
+    return bytes([_ALGORITHMS[algorithm]]) + dict_id.to_bytes(4, 'big') + payload
+
+
+def decompress(config, blob):
+    blob = bytes(blob)
+    code, dict_id, payload = blob[0], int.from_bytes(blob[1:5], 'big'), blob[5:]
+    data = _dictionary(config, dict_id) if dict_id else None
+    if code == _ALGORITHMS['zlib']:
+        decompressor = zlib.decompressobj(-15, zdict=data) if data else zlib.decompressobj(-15)
+        raw = decompressor.decompress(payload) + decompressor.flush()
+    elif code == _ALGORITHMS['zstd']:
+        import zstandard
+        dict_data = zstandard.ZstdCompressionDict(data) if data else None
+        raw = zstandard.ZstdDecompressor(dict_data=dict_data).decompress(payload)
+    else:
+        raise ValueError(f"未知的壓縮格式: {code}")
+    return raw.decode('utf-8')
+
+
+# 依目前的設定轉成寫入資料庫的 (文字欄位, 壓縮欄位)
+def encode(config, text):
+    if not BODY_COMPRESSION or text is None:
+        return text, None
+    return None, compress(config, text)
+
+
+# 由資料庫讀出的 (文字欄位, 壓縮欄位) 還原內文
+def decode(config, text, blob):
+    return decompress(config, blob) if blob is not None else text
+
+
+# zlib 的字典：挑出在多篇新聞稿中重複出現的片段，依節省的位元組數排序填滿 32 KB；
+# 離結尾越近的內容參照成本越低，因此最常用的片段放在最後
+def _train_zlib(samples, size):
+    counts = Counter()
+    for text in samples:
+        for fragment in set(re.split(r'(?<=[。，、；：！？\n])', text)):
+            fragment = fragment.strip()
+            if 4 <= len(fragment) <= 200:
+                counts[fragment] += 1
+    chosen = []
+    total = 0
+    ranked = sorted(counts.items(), key=lambda item: item[1] * len(item[0]), reverse=True)
+    for fragment, count in ranked:
+        data = fragment.encode('utf-8')
+        if count < 2 or total + len(data) > size:
+            continue
+        chosen.append(data)
+        total += len(data)
+    return b''.join(reversed(chosen))
+
+
+# 以各來源抽樣的內文訓練新字典，回傳字典編號；之後寫入的資料會使用新字典，舊資料仍以原字典解壓縮
+def train(config, algorithm=None, log=print):
+    algorithm = algorithm or BODY_COMPRESSION or 'zlib'
+    samples = []
+    seen = 0
+    preload(config)
+    for source in sources.SOURCES.values():
+        for text, blob in storage.iter_rows(config, source.table,
+                                            [source.body_column, source.compressed_column]):
+            text = decode(config, text, blob)
+            if not text:
+                continue
+            # 蓄水池抽樣，不需先知道總筆數
+            seen += 1
+            if len(samples) < BODY_DICT_SAMPLES:
+                samples.append(text)
+            elif random.randrange(seen) < BODY_DICT_SAMPLES:
+                samples[random.randrange(BODY_DICT_SAMPLES)] = text
+    if not samples:
+        log("沒有可用來訓練字典的資料")
+        return 0
+    if algorithm == 'zlib':
+        data = _train_zlib(samples, _DICT_SIZES[algorithm])
+    else:
+        import zstandard
+        data = zstandard.train_dictionary(_DICT_SIZES[algorithm],
+                                          [text.encode('utf-8') for text in samples]).as_bytes()
+    with storage.connection(config) as cnx:
+        cursor = cnx.cursor()
+        cursor.execute("INSERT INTO body_dictionaries (algorithm, data) VALUES (%s, %s)", (algorithm, data))
+        dict_id = cursor.lastrowid
+        cnx.commit()
+        cursor.close()
+    with _lock:
+        _current[(storage.config_key(config), algorithm)] = (dict_id, data)
+        _dictionaries[(storage.config_key(config), dict_id)] = data
+    log(f"已以 {len(samples)} 筆資料訓練 {algorithm} 字典 {dict_id}（{len(data)} bytes）")
+    return dict_id
+
+
+# 分批將既有資料轉成目前的儲存方式（壓縮或未壓縮），每批各自 commit，中斷後可再次執行接續
+def convert(config, source, batch_size=500, log=print):
+    body, compressed = source.body_column, source.compressed_column
+    pending = f"{compressed} IS NULL AND {body} IS NOT NULL" if BODY_COMPRESSION else f"{compressed} IS NOT NULL"
+    last_id = 0
+    converted = raw_bytes = stored_bytes = 0
+    preload(config)
+    while True:
+        with storage.connection(config) as cnx:
+            cursor = cnx.cursor()
+            cursor.execute(f"SELECT id, {body}, {compressed} FROM {source.table} "
+                           f"WHERE id > %s AND {pending} ORDER BY id LIMIT %s", (last_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                cursor.close()
+                break
+            updates = []
+            for row_id, text, blob in rows:
+                text = decode(config, text, blob)
+                new_text, new_blob = encode(config, text)
+                raw_bytes += len(text.encode('utf-8'))
+                stored_bytes += len(new_blob) if new_blob is not None else len(text.encode('utf-8'))
+                updates.append((new_text, new_blob, row_id))
+            cursor.executemany(f"UPDATE {source.table} SET {body} = %s, {compressed} = %s WHERE id = %s",
+                               updates)
+            cnx.commit()
+            cursor.close()
+        last_id = rows[-1][0]
+        converted += len(rows)
+        log(f"[{source.name}] 已轉換 {converted} 筆")
+    if converted:
+        log(f"[{source.name}] 共轉換 {converted} 筆：{raw_bytes} → {stored_bytes} bytes"
+            f"（{raw_bytes / max(stored_bytes, 1):.1f} 倍）")
+    return converted
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='內文壓縮字典的訓練與既有資料的轉換')
+    parser.add_argument('--train', action='store_true', help='以現有資料訓練新的壓縮字典')
+    parser.add_argument('--convert', action='store_true', help='將既有資料轉為 BODY_COMPRESSION 指定的儲存方式')
+    parser.add_argument('--source', choices=sorted(sources.SOURCES), action='append',
+                        help='只轉換指定來源（預設為全部）')
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+
+    config = storage.env_config()
+    try:
+        if args.train:
+            train(config)
+        if args.convert:
+            for name in (args.source or sources.SOURCES):
+                convert(config, sources.SOURCES[name], args.batch_size)
+    except (*storage.DB_ERRORS, ImportError, ValueError) as err:
+        print(f"Error: {err}")
+        sys.exit(1)
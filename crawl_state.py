@@ -0,0 +1,130 @@
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import sources
+import storage
+
+# 增量爬取狀態檔：記錄每個來源已看過的最新日期（高水位）與該日期的網址
+CRAWL_STATE_PATH = os.getenv('CRAWL_STATE_PATH', 'crawl_state.json')
+
+_lock = threading.Lock()
+
+
+# 讀取、修改、寫回狀態檔時持有的鎖：行程內以 _lock，行程間（爬蟲、網頁服務、命令列匯出同時執行）
+# 以狀態檔旁的 .lock 檔案鎖，避免彼此覆蓋對方的更新。只讀取時不需檔案鎖，狀態檔一律以 os.replace 整份替換
+@contextmanager
+def _locked():
+    with _lock, open(CRAWL_STATE_PATH + '.lock', 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+# 將 2024-05-01、113/05/01 等格式的日期轉成可比較的數字序列
+def date_key(date_str):
+    try:
+        return tuple(int(part) for part in re.split(r'[-/.]', date_str.strip()))
+    except (ValueError, AttributeError):
+        return None
+
+
+def _load():
+    try:
+        with open(CRAWL_STATE_PATH, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _save(state):
+    tmp_path = CRAWL_STATE_PATH + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, CRAWL_STATE_PATH)
+
+
+# 以資料庫與資料表組成來源名稱，避免不同資料庫共用同一個高水位
+def source_key(config, table):
+    if storage.backend_name(config) == 'sqlite':
+        return f"sqlite:{storage.sqlite_path(config)}/{table}"
+    return f"{config.get('host')}/{config.get('database')}/{table}"
+
+
+# 讀取來源的高水位，格式為 {'date': ..., 'urls': [...]}
+def get_high_water(source):
+    with _lock:
+        return _load().get(source, {}).get('high_water')
+
+
+# 判斷列表中的一筆資料是否已確認存入資料庫（只依列表資訊判斷，不需下載內文）：
+# 只有網址為高水位記錄的網址時才成立。日期早於高水位但網址不同的資料（例如事後補登、日期較早的新聞稿）
+# 不會因日期被略過，仍由網址索引或資料庫確認；日期無法解析的資料不參與判斷
+def is_known(high_water, date, url):
+    if not high_water or date == sources.UNKNOWN_DATE:
+        return False
+    return url in high_water['urls']
+
+
+# 以已確認存入資料庫的資料推進高水位
+def advance(source, rows):
+    rows = [(date, url) for _, date, url in rows if date_key(date) is not None and date != sources.UNKNOWN_DATE]
+    if not rows:
+        return
+    with _locked():
+        state = _load()
+        entry = state.setdefault(source, {})
+        high_water = entry.get('high_water') or {'date': rows[0][0], 'urls': []}
+        newest = max(rows, key=lambda row: date_key(row[0]))[0]
+        if date_key(newest) > date_key(high_water['date']):
+            high_water = {'date': newest, 'urls': []}
+        urls = set(high_water['urls'])
+        urls.update(url for date, url in rows if date_key(date) == date_key(high_water['date']))
+        high_water['urls'] = sorted(urls)
+        entry['high_water'] = high_water
+        _save(state)
+
+
+# 讀取匯出作業上次匯出到的資料 id，用於「只匯出上次之後新增的資料」
+def get_export_mark(source, name):
+    with _lock:
+        return _load().get(source, {}).get('exports', {}).get(name)
+
+
+# 匯出完成後記錄最後一筆資料的 id
+def set_export_mark(source, name, last_id):
+    with _locked():
+        state = _load()
+        state.setdefault(source, {}).setdefault('exports', {})[name] = last_id
+        _save(state)
+
+
+# 讀取排程工作上次成功執行的時間（epoch 秒），從未執行過時為 None
+def get_last_run(source):
+    with _lock:
+        return _load().get(source, {}).get('last_run')
+
+
+def set_last_run(source, timestamp):
+    with _locked():
+        state = _load()
+        state.setdefault(source, {})['last_run'] = timestamp
+        _save(state)
@@ -0,0 +1,388 @@
+import atexit
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+import requests
+from mysql.connector import errorcode
+import body_codec
+import crawl_state
+import fetcher
+from frontier import CrawlFrontier
+import http_cache
+import http_client
+import metrics
+import migrate
+import pipeline
+import profiling
+import result_cache
+import revisit
+import scheduler
+import search
+import sources
+import storage
+import url_index
+
+# 增量模式：依各來源的高水位判斷列表資料是否已爬過，遇到既有資料即停止往下一頁爬取；
+# 設為 0 時為全量回補，略過既有資料但會爬完指定的全部頁數，補上較早頁面中缺漏的資料
+CRAWL_INCREMENTAL = os.getenv('CRAWL_INCREMENTAL', '1') == '1'
+# 解析階段的執行緒數與每次寫入資料庫的最大筆數
+PARSE_WORKERS = int(os.getenv('PARSE_WORKERS', '2'))
+DB_BATCH_SIZE = int(os.getenv('DB_BATCH_SIZE', '100'))
+# 多行程解析：PARSE_PROCESSES 大於 0 時改用行程池解析，每批送出 PARSE_CHUNK_SIZE 頁；
+# 只在多核心機器上有效果，行程數不應超過核心數（單核心時與執行緒解析相當或更慢）
+PARSE_PROCESSES = int(os.getenv('PARSE_PROCESSES', '0'))
+PARSE_CHUNK_SIZE = int(os.getenv('PARSE_CHUNK_SIZE', '16'))
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+_cache_lookups = metrics.counter('http_cache_lookups_total', '本機回應快取查詢次數', ('result',))
+_listing_pages = metrics.counter('crawler_listing_pages_total', '已處理的列表頁數', ('source',))
+_rows_written = metrics.counter('crawler_rows_total', '寫入資料庫的筆數', ('source', 'result'))
+_listing_seconds = metrics.histogram('crawler_listing_seconds', '下載列表頁的耗時', ('source',))
+_exists_seconds = metrics.histogram('crawler_exists_check_seconds', '判斷列表資料是否已存在的耗時', ('source',))
+_stage_seconds = metrics.histogram('crawler_stage_seconds',
+                                   '管線各階段每筆的耗時：fetch 下載內文、parse 擷取內文、sink 寫入資料庫',
+                                   ('source', 'stage'))
+
+
+def _observe_stage(pipe_name, stage_name, seconds, count):
+    for _ in range(count):
+        _stage_seconds.observe(seconds / count, source=pipe_name, stage=stage_name)
+
+
+pipeline.add_listener(_observe_stage)
+
+
+# 爬取給定的URL；回應不是 2xx 時丟出 requests.HTTPError，錯誤頁面不會被當成內文儲存
+def fetch_page_content(url):
+    cached = http_cache.get(url)
+    if cached is not None:
+        _cache_lookups.inc(result='hit')
+        return cached
+    if http_cache.enabled():
+        _cache_lookups.inc(result='miss')
+    response = http_client.get(url)
+    response.raise_for_status()
+    http_cache.put(url, response.text)
+    return response.text
+
+
+# 下載失敗的內文頁：經過解析階段原樣傳到寫入端，不寫入資料庫，該頁的高水位與列表驗證資訊也不更新，
+# 下次爬取時仍會被視為新資料重新下載
+class _FetchFailed:
+    def __init__(self, item, error):
+        self.item = item
+        self.error = error
+
+
+def _no_progress(name, count=1):
+    pass
+
+
+# 取得解析用的行程池，依 PARSE_PROCESSES 建立並於各次爬取間共用。
+# 子行程以 forkserver（不支援時為 spawn）啟動：爬取時有多個執行緒持有鎖與連線，fork 會複製到子行程中
+def _get_process_pool():
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _process_pool = ProcessPoolExecutor(max_workers=PARSE_PROCESSES,
+                                                mp_context=multiprocessing.get_context(method))
+        return _process_pool
+
+
+# 程式結束時關閉行程池，等待子行程結束
+def _shutdown_process_pool():
+    global _process_pool
+    with _process_pool_lock:
+        pool, _process_pool = _process_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+atexit.register(_shutdown_process_pool)
+
+
+# 在子行程中執行：解析一批 HTML，只回傳擷取出的文字
+def _extract_batch(extract, htmls):
+    return [extract(html) for html in htmls]
+
+
+# 從一整頁列表中挑出需要下載的新資料：網址為高水位記錄的資料直接視為已存在，其餘以網址索引或一次查詢比對資料庫。
+# 整頁都會檢查，夾在既有資料之間、日期較早的新資料也會下載；增量模式下頁面中有既有資料時，不再往下一頁爬取。
+# 回傳 (新資料, 已存在的資料, 是否已遇到既有資料)
+def select_new(candidates, config, table, high_water, log=print, index=None):
+    # 增量模式：高水位記錄的網址已確認存入資料庫，不必查詢
+    known = {row for row in candidates if crawl_state.is_known(high_water, row[1], row[2])}
+    unchecked = [row for row in candidates if row not in known]
+
+    if index is not None:
+        # 索引判定已存在的資料直接採信；索引只包含載入時的資料與本行程寫入的網址，
+        # 判定為新的資料可能已由其他行程寫入，仍以一次查詢向資料庫確認
+        known.update(row for row in unchecked if row[2] in index)
+        unchecked = [row for row in unchecked if row not in known]
+    if unchecked:
+        try:
+            known_urls = storage.existing_urls(config, table, [row[2] for row in unchecked])
+        except storage.DB_ERRORS as err:
+            log(f"Error: {err}")
+            known_urls = set()
+        known.update(row for row in unchecked if row[2] in known_urls)
+        if index is not None:
+            for url in known_urls:
+                index.add(url)
+
+    new_items = []
+    stored = []
+    for row in candidates:
+        if row in known:
+            log(f"資料已存在: {row[0]}")
+            stored.append(row)
+        else:
+            new_items.append(row)
+    return new_items, stored, bool(stored)
+
+
+# 資料庫寫入階段：累積解析完成的資料，於每頁結束或達到批次大小時以一次 executemany 寫入
+class _Writer:
+    def __init__(self, config, table, columns, state_key, incremental, log, index=None, progress=None):
+        self.pipe = None
+        self.progress = progress or _no_progress
+        self.index = index
+        self.config = config
+        self.table = table
+        self.columns = columns
+        self.state_key = state_key
+        self.incremental = incremental
+        self.log = log
+        self.rows = []
+        self.stored = []
+        self.failed = False
+        self.db_seconds = 0.0
+
+    def __call__(self, payload):
+        if isinstance(payload, _FetchFailed):
+            self.failed = True
+            return
+        if isinstance(payload, pipeline.Marker):
+            url, response, known = payload.value
+            self.stored.extend(known)
+            if self.write() and not self.failed:
+                if self.incremental:
+                    crawl_state.advance(self.state_key, self.stored)
+                http_client.remember(self.state_key, url, response)
+            self.stored = []
+            self.failed = False
+            return
+        self.rows.append(payload)
+        if len(self.rows) >= DB_BATCH_SIZE:
+            self.write()
+
+    def write(self):
+        rows, self.rows = self.rows, []
+        started = time.perf_counter()
+        try:
+            # 連同正規化內文的指紋一起寫入，供重新檢查時比對是否被修改；內文依設定壓縮
+            values = []
+            for title, date, news_url, content in rows:
+                text, blob = body_codec.encode(self.config, content)
+                values.append((title, date, news_url, text, revisit.content_hash(content), blob))
+            storage.upsert_rows(self.config, self.table, self.columns, values)
+        except storage.DB_ERRORS as err:
+            self.db_seconds += time.perf_counter() - started
+            self.failed = True
+            self.progress('errors')
+            _rows_written.inc(len(rows), source=self.pipe.name, result='error')
+            errno = getattr(err, 'errno', None)  # SQLite 的錯誤沒有錯誤碼
+            if errno == errorcode.ER_ACCESS_DENIED_ERROR:
+                self.log("使用者名稱或密碼錯誤")
+            elif errno == errorcode.ER_BAD_DB_ERROR:
+                self.log("資料庫不存在")
+            else:
+                self.log(str(err))
+            if errno in (errorcode.ER_ACCESS_DENIED_ERROR, errorcode.ER_BAD_DB_ERROR):
+                self.pipe.cancel()  # 連線設定錯誤時通知上游停止，不再下載後續頁面
+            return False
+        self.db_seconds += time.perf_counter() - started
+        _rows_written.inc(len(rows), source=self.pipe.name, result='inserted')
+        if rows:
+            result_cache.invalidate(self.table)  # 查詢 API 的快取結果已過期
+            if search.SEARCH_INDEX:
+                try:
+                    search.add(self.state_key, rows)
+                except sqlite3.Error as err:
+                    self.log(f"全文索引更新失敗: {err}")
+        self.progress('inserted', len(rows))
+        for row in rows:
+            if self.index is not None:
+                self.index.add(row[2])
+            self.log(f"資料已成功插入: {row[0]}")
+        self.stored.extend(row[:3] for row in rows)
+        return True
+
+
+# 以串流管線爬取一個來源：列表產生 → 下載內文 → 解析 → 寫入資料庫，各階段以有界佇列串接並同時進行。
+# 回傳 True 表示（增量模式下）已遇到既有資料或列表未更新，應停止爬取。
+def crawl_source(source, pages, config, log=print, incremental=CRAWL_INCREMENTAL, frontier=None, progress=None):
+    # 資料表結構過舊時，寫入會因缺少欄位而整批失敗；開始前先確認，提示執行 migrate.py
+    migrate.check_schema(config)
+    progress = progress or _no_progress
+    totals = {'listing_seconds': 0.0}
+    totals_lock = threading.Lock()
+
+    # 同時累計本次執行的統計，結束時輸出一行摘要
+    def track(name, count=1):
+        with totals_lock:
+            totals[name] = totals.get(name, 0) + count
+        progress(name, count)
+
+    frontier = frontier if frontier is not None else CrawlFrontier()
+    state_key = crawl_state.source_key(config, source.table)
+    high_water = crawl_state.get_high_water(state_key) if incremental else None
+    index = url_index.get_index(config, source.table, log) if url_index.URL_INDEX else None
+    stopped = []
+
+    def produce(pipe):
+        for url in frontier.filter(source.listing_urls(pages)):
+            if pipe.cancelled:
+                return
+            started = time.perf_counter()
+            response = http_client.get(url, scope=state_key if incremental else None)
+            elapsed = time.perf_counter() - started
+            totals['listing_seconds'] += elapsed
+            _listing_seconds.observe(elapsed, source=source.name)
+            if response.status_code == 304:
+                log(f"列表未更新: {url}")
+                stopped.append(url)
+                return
+            # 列表頁失敗時停止此來源，錯誤頁不會被當成空白列表而繼續往下一頁
+            response.raise_for_status()
+            track('pages')
+            _listing_pages.inc(source=source.name)
+            candidates = source.parse_listing(response.text)
+            with _exists_seconds.time(source=source.name):
+                new_items, known, reached_known = select_new(candidates, config, source.table,
+                                                             high_water, log, index)
+            # 列表在爬取期間新增資料時，同一篇可能出現在相鄰兩頁，只下載一次
+            yield from (item for item in new_items if frontier.claim(item[2]))
+            yield pipeline.Marker((url, response, known))
+            # 全量回補時既有資料只略過，繼續爬取後面的頁面
+            if reached_known and incremental:
+                stopped.append(url)
+                return
+
+    # 單篇下載失敗（HTTP 錯誤、逾時、重試用盡）只略過該篇並記為錯誤，不中斷整個來源的爬取
+    def fetch(item):
+        try:
+            html_content = fetcher.fetch_one(fetch_page_content, item[2])
+        except requests.RequestException as err:
+            log(f"下載失敗: {item[2]} ({err})")
+            track('errors')
+            return _FetchFailed(item, err)
+        track('fetched')
+        track('bytes', len(html_content.encode('utf-8')))
+        return item, html_content
+
+    def parse(fetched):
+        if isinstance(fetched, _FetchFailed):
+            return fetched
+        (title, date, news_url), html_content = fetched
+        return title, date, news_url, source.extract(html_content)
+
+    # 多行程模式：整批 HTML 送到子行程解析，只傳回擷取出的文字
+    def parse_batch(batch):
+        fetched = [entry for entry in batch if not isinstance(entry, _FetchFailed)]
+        contents = iter(_get_process_pool().submit(_extract_batch, source.extract,
+                                                   [html for _, html in fetched]).result() if fetched else ())
+        return [entry if isinstance(entry, _FetchFailed) else (*entry[0], next(contents)) for entry in batch]
+
+    columns = source.columns + ('content_hash', source.compressed_column)
+    writer = _Writer(config, source.table, columns, state_key, incremental, log, index, track)
+    pipe = pipeline.Pipeline(source.name, produce, [
+        pipeline.Stage('fetch', fetch, workers=fetcher.FETCH_WORKERS),
+        pipeline.Stage('parse', parse_batch, workers=PARSE_PROCESSES, batch_size=PARSE_CHUNK_SIZE)
+        if PARSE_PROCESSES > 0 else pipeline.Stage('parse', parse, workers=PARSE_WORKERS),
+    ], writer, flush=writer.write)
+    writer.pipe = pipe
+    try:
+        pipe.run()
+    finally:
+        log(f"[{source.name}] 本次統計: 列表 {totals.get('pages', 0)} 頁 / {totals['listing_seconds']:.2f} 秒，"
+            f"內文 {totals.get('fetched', 0)} 篇 / {totals.get('bytes', 0) // 1024} KB，"
+            f"寫入 {totals.get('inserted', 0)} 筆，錯誤 {totals.get('errors', 0)} 次；"
+            + ", ".join(f"{s['stage']} {s['processed']} 筆 / {s['busy_seconds']} 秒" for s in pipe.stats())
+            + f", 資料庫 {writer.db_seconds:.2f} 秒")
+    return bool(stopped)
+
+
+# 同時爬取多個來源，共用 HTTP 連線、資料庫連線池與網址集合；各來源的錯誤分別記錄，不影響其他來源
+def crawl_all(pages, config, names=None, log=print, progress=None):
+    selected = [sources.SOURCES[name] for name in (names or sources.SOURCES)]
+    frontier = CrawlFrontier()
+    errors = {}
+
+    def run(source):
+        try:
+            crawl_source(source, pages, config, log=log, frontier=frontier, progress=progress)
+        except Exception as err:
+            errors[source.name] = err
+            log(f"[{source.name}] 爬取失敗: {err}")
+
+    threads = [threading.Thread(target=run, args=(source,), name=f"crawl-{source.name}")
+               for source in selected]
+    with profiling.profile('crawl_all', log=log):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    if frontier.duplicates:
+        log(f"略過重複網址 {frontier.duplicates} 次")
+    return errors
+
+
+# 定義函式來爬取指定頁數的監察院新聞稿
+def crawl_news(pages, config, log=print, progress=None):
+    with profiling.profile('crawl_news', log=log):
+        crawl_source(sources.CONTROL_YUAN, pages, config, log=log, progress=progress)
+
+
+# 單一排程同時爬取所有來源：python crawler.py [--profile cprofile|sample|all]
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='定期爬取所有來源')
+    parser.add_argument('--profile', nargs='?', const='all', choices=profiling.MODES,
+                        help='分析第一次爬取的效能，結果寫到 CRAWL_PROFILE_DIR')
+    args = parser.parse_args()
+    if args.profile:
+        profiling.request_once(args.profile)
+
+    config = storage.env_config()
+    names = [name for name in os.getenv('CRAWL_SOURCES', ','.join(sources.SOURCES)).split(',') if name]
+    pages = int(os.getenv('CRAWL_PAGES', '5'))
+    interval_days = int(os.getenv('CRAWL_INTERVAL_DAYS', '3'))
+
+    revisit_enabled = os.getenv('CRAWL_REVISIT', '1') == '1'
+
+    # 每個來源各自排程，到期時在背景執行緒爬取，同一來源同時只會有一次爬取
+    def scheduled_crawl(name):
+        with profiling.profile(f'scheduled_crawl_{name}'):
+            errors = crawl_all(pages, config, [name])
+            if revisit_enabled:
+                # 依發布天數遞減的頻率重新檢查已儲存的資料是否被修改
+                errors.update(revisit.revisit_all(config, [name]))
+        # 回報失敗讓排程器稍後重試，而不是等到下一個間隔
+        if errors:
+            raise RuntimeError('; '.join(f"{source}: {err}" for source, err in errors.items()))
+
+    crawl_scheduler = scheduler.Scheduler()
+    for name in names:
+        crawl_scheduler.add(name, interval_days * 86400, lambda name=name: scheduled_crawl(name),
+                            crawl_state.source_key(config, sources.SOURCES[name].table))
+    for entry in crawl_scheduler.status():
+        print(f"[{entry['name']}] 每 {interval_days} 天爬取一次，下次執行: "
+              f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['next_run']))}")
+    crawl_scheduler.run_forever()
@@ -0,0 +1,187 @@
+import argparse
+import csv
+import datetime
+import io
+import json
+import os
+import sys
+import tempfile
+
+import body_codec
+import crawl_state
+import sources
+import storage
+
+# 串流匯出已儲存的資料為 JSONL、CSV 或 Parquet：
+#   python export.py --source cy --format jsonl --output cy.jsonl --since 2024-01-01
+#   python export.py --source nhrc --format parquet --output nhrc.parquet --incremental analyst
+# 以不緩衝的游標依 id 順序每次讀出 EXPORT_CHUNK_SIZE 筆並立即寫出（Parquet 每批為一個 row group），
+# 記憶體用量與資料表大小無關。--incremental 以名稱記錄上次匯出到的 id，下次只匯出其後新增的資料。
+# HTTP API 只有 POST 會推進匯出位置，GET 只讀取（見 read_api）。
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '1000'))
+
+FORMATS = ('jsonl', 'csv', 'parquet')
+MIMETYPES = {
+    'jsonl': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def _text(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+# 依 id 順序分批讀出資料，每批為 dict 清單（一定包含 id）；name 有值時只讀出該名稱上次匯出之後的資料，
+# advance 為真時於全部讀完後才記錄匯出位置
+def iter_chunks(config, source, fields, since=None, until=None, name=None, chunk_size=EXPORT_CHUNK_SIZE,
+                advance=True):
+    state_key = crawl_state.source_key(config, source.table)
+    after_id = crawl_state.get_export_mark(state_key, name) if name else None
+    columns = list(dict.fromkeys(['id'] + list(fields)))
+    if source.body_column in columns:
+        columns.append(source.compressed_column)
+    where = []
+    params = []
+    if after_id is not None:
+        where.append("id > %s")
+        params.append(after_id)
+    if since is not None:
+        where.append("date >= %s")
+        params.append(since)
+    if until is not None:
+        where.append("date <= %s")
+        params.append(until)
+    query = f"SELECT {', '.join(columns)} FROM {source.table}"
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    query += " ORDER BY id"
+
+    last_id = after_id
+    if source.compressed_column in columns:
+        body_codec.preload(config)
+    with storage.connection(config) as cnx:
+        cursor = cnx.cursor(buffered=False)
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            chunk = []
+            for row in rows:
+                record = dict(zip(columns, row))
+                if source.compressed_column in record:
+                    record[source.body_column] = body_codec.decode(
+                        config, record[source.body_column], record.pop(source.compressed_column))
+                chunk.append(record)
+            last_id = chunk[-1]['id']
+            yield chunk
+        cursor.close()
+    if name and advance and last_id is not None:
+        crawl_state.set_export_mark(state_key, name, last_id)
+
+
+def _jsonl(chunks, fields):
+    for chunk in chunks:
+        yield ''.join(json.dumps({name: _text(record[name]) for name in fields}, ensure_ascii=False) + '\n'
+                      for record in chunk).encode('utf-8')
+
+
+# CSV 開頭加上 BOM，Excel 才會以 UTF-8 開啟
+def _csv(chunks, fields):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(fields)
+    for chunk in chunks:
+        writer.writerows([_text(record[name]) for name in fields] for record in chunk)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+# 以 pyarrow 寫出 Parquet，每批資料寫成一個 row group
+def _write_parquet(chunks, fields, out):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    types = {'id': pa.int64(), 'date': pa.date32()}
+    schema = pa.schema([(name, types.get(name, pa.string())) for name in fields])
+    with pq.ParquetWriter(out, schema, compression='zstd') as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pylist(
+                [{name: record[name] for name in fields} for record in chunk], schema=schema))
+
+
+# 匯出到已開啟的二進位檔案，回傳匯出的筆數
+def export(config, source, fmt, out, fields=None, since=None, until=None, name=None, log=print):
+    fields = list(fields or ('id',) + source.columns)
+    count = 0
+
+    def counted(chunks):
+        nonlocal count
+        for chunk in chunks:
+            count += len(chunk)
+            yield chunk
+
+    chunks = counted(iter_chunks(config, source, fields, since, until, name))
+    if fmt == 'parquet':
+        _write_parquet(chunks, fields, out)
+    else:
+        for data in (_jsonl if fmt == 'jsonl' else _csv)(chunks, fields):
+            out.write(data)
+    log(f"[{source.name}] 已匯出 {count} 筆")
+    return count
+
+
+# 供 HTTP 回應使用的串流：JSONL 與 CSV 邊讀邊輸出；Parquet 的檔尾需在最後寫入，先寫到暫存檔再分段輸出。
+# advance 為假時只讀取 name 的匯出位置，不推進
+def stream(config, source, fmt, fields=None, since=None, until=None, name=None, advance=True):
+    fields = list(fields or ('id',) + source.columns)
+    chunks = iter_chunks(config, source, fields, since, until, name, advance=advance)
+    if fmt != 'parquet':
+        yield from (_jsonl if fmt == 'jsonl' else _csv)(chunks, fields)
+        return
+    with tempfile.TemporaryFile() as tmp:
+        _write_parquet(chunks, fields, tmp)
+        tmp.seek(0)
+        while True:
+            data = tmp.read(64 * 1024)
+            if not data:
+                break
+            yield data
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='匯出已儲存的新聞稿')
+    parser.add_argument('--source', choices=sorted(sources.SOURCES), required=True)
+    parser.add_argument('--format', choices=FORMATS, default='jsonl')
+    parser.add_argument('--output', default='-', help='輸出檔案，- 表示標準輸出（Parquet 必須指定檔案）')
+    parser.add_argument('--fields', help='以逗號分隔的欄位，預設為全部')
+    parser.add_argument('--since', type=datetime.date.fromisoformat, help='起始日期 YYYY-MM-DD')
+    parser.add_argument('--until', type=datetime.date.fromisoformat, help='結束日期 YYYY-MM-DD')
+    parser.add_argument('--incremental', metavar='NAME', help='只匯出此名稱上次匯出之後新增的資料')
+    args = parser.parse_args()
+
+    source = sources.SOURCES[args.source]
+    fields = args.fields.split(',') if args.fields else None
+    allowed = ('id',) + source.columns
+    if fields and any(name not in allowed for name in fields):
+        parser.error(f"可用欄位: {', '.join(allowed)}")
+    if args.format == 'parquet' and args.output == '-':
+        parser.error('Parquet 必須以 --output 指定檔案')
+
+    config = storage.env_config()
+    out = sys.stdout.buffer if args.output == '-' else open(args.output, 'wb')
+    try:
+        export(config, source, args.format, out, fields, args.since, args.until, args.incremental,
+               log=lambda message: print(message, file=sys.stderr))
+    except (*storage.DB_ERRORS, ImportError) as err:
+        print(f"Error: {err}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
@@ -0,0 +1,41 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+# 同時下載的執行緒數與每個主機的同時連線上限
+FETCH_WORKERS = int(os.getenv('FETCH_WORKERS', '8'))
+FETCH_PER_HOST = int(os.getenv('FETCH_PER_HOST', '4'))
+
+_executor = None
+_host_limits = {}
+_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix='fetch')
+        return _executor
+
+
+# 取得主機對應的號誌，限制對同一主機的同時請求數
+def _host_limit(url):
+    host = urlsplit(url).netloc
+    with _lock:
+        limit = _host_limits.get(host)
+        if limit is None:
+            limit = _host_limits[host] = threading.BoundedSemaphore(FETCH_PER_HOST)
+        return limit
+
+
+# 在主機連線上限內下載單一網址
+def fetch_one(fetch, url):
+    with _host_limit(url):
+        return fetch(url)
+
+
+# 並行下載多個網址，依輸入順序逐一產出結果；遇到例外時尚未開始的下載會被取消
+def fetch_all(fetch, urls):
+    return _get_executor().map(lambda url: fetch_one(fetch, url), urls)
@@ -0,0 +1,26 @@
+import threading
+
+
+# 一次爬取執行期間的網址集合：確保每個列表頁與內文頁最多只下載一次
+class CrawlFrontier:
+    def __init__(self):
+        self._seen = set()
+        self._lock = threading.Lock()
+        self.duplicates = 0
+
+    # 第一次看到網址時回傳 True，之後再出現則回傳 False 並計入重複次數
+    def claim(self, url):
+        with self._lock:
+            if url in self._seen:
+                self.duplicates += 1
+                return False
+            self._seen.add(url)
+            return True
+
+    # 依序產出尚未處理過的網址
+    def filter(self, urls):
+        return (url for url in urls if self.claim(url))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._seen)
@@ -1,18 +1,21 @@
-import requests
-from bs4 import BeautifulSoup
-import mysql.connector
-from mysql.connector import errorcode
+import crawl_state
+import crawler
+import scheduler
+import sources
 import sys
-import schedule
-import time
 from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QFormLayout,
                              QLineEdit, QPushButton, QLabel, QTextEdit, QSpinBox, QHBoxLayout)
-from PyQt5.QtCore import QTimer, Qt
+from PyQt5.QtCore import Qt, pyqtSignal
 
 class CrawlerApp(QWidget):
+    # 爬取在排程器的背景執行緒中進行，訊息經由 signal 交給主執行緒顯示
+    log_message = pyqtSignal(str)
+
     def __init__(self):
         super().__init__()
 
+        self.scheduler = scheduler.Scheduler(log=self.log)
+        self.log_message.connect(self.append_log)
         self.initUI()
 
     def initUI(self):
@@ -84,102 +87,27 @@ class CrawlerApp(QWidget):
         
         self.log(f"Configuration set. DB Host: {self.config['host']}, DB User: {self.config['user']}, DB Name: {self.config['database']}, Crawl Interval: {self.crawl_interval_days_value} days")
         
-        self.scheduled_crawl()
-        
-        schedule.every(self.crawl_interval_days_value).days.do(self.scheduled_crawl)
+        # 重新設定時以新的資料庫與間隔取代原本的排程，並立即爬取一次（已在爬取中則不重複）；
+        # 排程時不立即執行，否則排程執行緒先開始爬取後，run_now 會讓同一次設定再爬取一次
+        self.scheduler.add('cy', self.crawl_interval_days_value * 86400, self.scheduled_crawl,
+                           crawl_state.source_key(self.config, sources.CONTROL_YUAN.table), immediate=False)
+        self.scheduler.run_now('cy')
+        self.scheduler.start()
         
         self.log(f"Scheduled crawl every {self.crawl_interval_days_value} days")
-        
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.run_pending)
-        self.timer.start(1000)
-        
-    def run_pending(self):
-        schedule.run_pending()
     
     def log(self, message):
-        self.output.append(message)
-
-    def data_exists(self, title, date, url):
-        try:
-            cnx = mysql.connector.connect(**self.config)
-            cursor = cnx.cursor()
-
-            query = ("SELECT COUNT(*) FROM control_yuan_reports "
-                     "WHERE title = %s AND date = %s AND url = %s")
-            cursor.execute(query, (title, date, url))
-            count = cursor.fetchone()[0]
-
-            cursor.close()
-            cnx.close()
-            return count > 0
-
-        except mysql.connector.Error as err:
-            self.log(f"Error: {err}")
-            return False
-
-    def insert_data(self, title, date, url, content):
-        try:
-            cnx = mysql.connector.connect(**self.config)
-            cursor = cnx.cursor()
+        self.log_message.emit(str(message))
 
-            add_data = ("INSERT INTO control_yuan_reports "
-                        "(title, date, url, content) "
-                        "VALUES (%s, %s, %s, %s)")
-            data = (title, date, url, content)
-
-            cursor.execute(add_data, data)
-            cnx.commit()
-
-            cursor.close()
-            cnx.close()
-            self.log(f"Data inserted: {title}")
-
-        except mysql.connector.Error as err:
-            if err.errno == errorcode.ER_ACCESS_DENIED_ERROR:
-                self.log("Access denied: Invalid username or password")
-            elif err.errno == errorcode.ER_BAD_DB_ERROR:
-                self.log("Database does not exist")
-            else:
-                self.log(f"Error: {err}")
-
-    def fetch_page_content(self, url):
-        response = requests.get(url)
-        response.encoding = 'utf-8'  # 設定編碼為UTF-8
-        return response.text
+    def append_log(self, message):
+        self.output.append(message)
 
-    def extract_content_and_links(self, html_content):
-        soup = BeautifulSoup(html_content, 'html.parser')
-        # 提取內文
-        content_div = soup.find('div', class_='area-essay page-caption-p')
-        content_text = content_div.get_text(strip=True, separator='\n') if content_div else 'No content found'
-        return content_text
+    def closeEvent(self, event):
+        self.scheduler.stop(wait=False)
+        super().closeEvent(event)
 
     def crawl_news(self, pages):
-        base_url = 'https://www.cy.gov.tw/News.aspx?_CSN=129&n=792&page={}&PageSize=100&sms=8912&Create=1'
-
-        for page in range(1, pages + 1):
-            url = base_url.format(page)
-            response = requests.get(url)
-            response.encoding = 'utf-8'
-
-            soup = BeautifulSoup(response.text, 'html.parser')
-            news_list = soup.select('table tbody tr')
-
-            for news in news_list:
-                date = news.find('span').text.strip()
-                title = news.find('a').text.strip()
-                link = news.find('a')['href']
-                news_url = 'https://www.cy.gov.tw/' + link
-                html_content = self.fetch_page_content(news_url)
-                content_text = self.extract_content_and_links(html_content)
-
-                # 檢查資料是否已存在，若不存在則插入資料
-                if not self.data_exists(title, date, news_url):
-                    self.insert_data(title, date, news_url, content_text)
-                else:
-                    self.log(f"Data already exists: {title}")
-                    return  # 停止函式執行
+        crawler.crawl_news(pages, self.config, log=self.log)
 
     def scheduled_crawl(self):
         self.crawl_news(5)
@@ -0,0 +1,163 @@
+import gzip
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+# 本機回應快取：設定 HTTP_CACHE_DIR 後啟用，未設定時完全不讀寫磁碟
+HTTP_CACHE_DIR = os.getenv('HTTP_CACHE_DIR', '')
+HTTP_CACHE_TTL = int(os.getenv('HTTP_CACHE_TTL', str(7 * 24 * 3600)))
+HTTP_CACHE_MAX_BYTES = int(os.getenv('HTTP_CACHE_MAX_BYTES', str(500 * 1024 * 1024)))
+
+_db = None
+_lock = threading.Lock()
+# 快取命中時只記在記憶體中的最後存取時間，於寫入快取時一併寫回索引，命中時不需 commit
+_touched = {}
+_TOUCH_FLUSH = 1000
+
+
+def enabled():
+    return bool(HTTP_CACHE_DIR)
+
+
+# 索引資料庫以 _lock 保護；內容檔的壓縮、解壓與讀寫都在鎖外進行，
+# 索引以 WAL 模式開啟，commit 不需 fsync，持有鎖的時間只有幾個查詢
+def _get_db():
+    global _db
+    if _db is None:
+        os.makedirs(os.path.join(HTTP_CACHE_DIR, 'blobs'), exist_ok=True)
+        _db = sqlite3.connect(os.path.join(HTTP_CACHE_DIR, 'index.db'),
+                              timeout=30, check_same_thread=False)
+        _db.execute("PRAGMA journal_mode=WAL")
+        _db.execute("PRAGMA synchronous=NORMAL")
+        _db.executescript(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " url TEXT PRIMARY KEY, hash TEXT NOT NULL,"
+            " fetched_at REAL NOT NULL, last_access REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS entries_hash ON entries (hash);"
+            "CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);"
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            " hash TEXT PRIMARY KEY, size INTEGER NOT NULL);")
+    return _db
+
+
+# 內容以 SHA-256 命名，相同內容的頁面只會存一份
+def _blob_path(digest):
+    return os.path.join(HTTP_CACHE_DIR, 'blobs', digest[:2], digest + '.gz')
+
+
+# 先寫到各執行緒自己的暫存檔再替換，同時寫入相同內容的執行緒不會互相覆蓋到一半的檔案
+def _write_blob(path, body):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with gzip.open(tmp_path, 'wb') as f:
+        f.write(body)
+    os.replace(tmp_path, path)
+
+
+def _remove_blobs(digests):
+    for digest in digests:
+        try:
+            os.remove(_blob_path(digest))
+        except FileNotFoundError:
+            pass
+
+
+def _flush_touched(db):
+    if _touched:
+        db.executemany("UPDATE entries SET last_access = ? WHERE url = ?",
+                       [(accessed, url) for url, accessed in _touched.items()])
+        _touched.clear()
+
+
+# 讀取快取；過期或不存在時回傳 None
+def get(url):
+    if not enabled():
+        return None
+    removed = []
+    with _lock:
+        db = _get_db()
+        row = db.execute("SELECT hash, fetched_at FROM entries WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        digest, fetched_at = row
+        expired = time.time() - fetched_at > HTTP_CACHE_TTL
+        if expired:
+            _touched.pop(url, None)
+            db.execute("DELETE FROM entries WHERE url = ?", (url,))
+            _drop_unreferenced(db, digest, removed)
+            db.commit()
+        else:
+            _touched[url] = time.time()
+            if len(_touched) >= _TOUCH_FLUSH:
+                _flush_touched(db)
+                db.commit()
+    if expired:
+        _remove_blobs(removed)
+        return None
+    try:
+        with gzip.open(_blob_path(digest), 'rb') as f:
+            body = f.read()
+    except (OSError, EOFError):
+        # 內容檔遺失或損毀（例如剛被淘汰）：移除仍指向此內容的索引
+        with _lock:
+            db = _get_db()
+            _touched.pop(url, None)
+            db.execute("DELETE FROM entries WHERE url = ? AND hash = ?", (url, digest))
+            _drop_unreferenced(db, digest, removed)
+            db.commit()
+        _remove_blobs(removed)
+        return None
+    return body.decode('utf-8')
+
+
+# 寫入快取，並在總大小超過上限時依最近最少使用的順序淘汰
+def put(url, text):
+    if not enabled():
+        return
+    body = text.encode('utf-8')
+    digest = hashlib.sha256(body).hexdigest()
+    path = _blob_path(digest)
+    if not os.path.exists(path):
+        _write_blob(path, body)
+    now = time.time()
+    removed = []
+    with _lock:
+        db = _get_db()
+        if db.execute("SELECT 1 FROM blobs WHERE hash = ?", (digest,)).fetchone() is None:
+            if not os.path.exists(path):
+                _write_blob(path, body)  # 寫入後、取得鎖前剛好被其他執行緒淘汰（少見）
+            db.execute("INSERT INTO blobs (hash, size) VALUES (?, ?)",
+                       (digest, os.path.getsize(path)))
+        old = db.execute("SELECT hash FROM entries WHERE url = ?", (url,)).fetchone()
+        db.execute("INSERT OR REPLACE INTO entries (url, hash, fetched_at, last_access) "
+                   "VALUES (?, ?, ?, ?)", (url, digest, now, now))
+        _touched.pop(url, None)
+        if old is not None and old[0] != digest:
+            _drop_unreferenced(db, old[0], removed)
+        _flush_touched(db)
+        _evict(db, removed)
+        db.commit()
+    _remove_blobs(removed)
+
+
+# 刪除已無任何網址引用的內容，內容檔加入 removed 待釋放鎖後刪除；回傳釋放的位元組數
+def _drop_unreferenced(db, digest, removed):
+    if db.execute("SELECT 1 FROM entries WHERE hash = ? LIMIT 1", (digest,)).fetchone() is not None:
+        return 0
+    row = db.execute("SELECT size FROM blobs WHERE hash = ?", (digest,)).fetchone()
+    db.execute("DELETE FROM blobs WHERE hash = ?", (digest,))
+    removed.append(digest)
+    return row[0] if row else 0
+
+
+def _evict(db, removed):
+    total = db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+    if total <= HTTP_CACHE_MAX_BYTES:
+        return
+    for url, digest in db.execute("SELECT url, hash FROM entries ORDER BY last_access").fetchall():
+        db.execute("DELETE FROM entries WHERE url = ?", (url,))
+        total -= _drop_unreferenced(db, digest, removed)
+        if total <= HTTP_CACHE_MAX_BYTES:
+            break
@@ -0,0 +1,104 @@
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import metrics
+
+# 連線與讀取逾時（秒），避免卡住的連線讓排程執行緒無限等待
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '30'))
+# 每個主機保留的 keep-alive 連線數
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '10'))
+# 儲存各網址 ETag / Last-Modified 的檔案，依來源名稱（crawl_state.source_key，含資料庫）分開記錄，
+# 某個資料庫已抓過的頁面對另一個資料庫仍會完整下載
+HTTP_VALIDATORS_PATH = os.getenv('HTTP_VALIDATORS_PATH', 'http_validators.json')
+
+_requests = metrics.counter('http_requests_total', 'HTTP 請求數（依主機與狀態碼）', ('host', 'status'))
+_bytes = metrics.counter('http_response_bytes_total', '下載的位元組數', ('host',))
+_seconds = metrics.histogram('http_request_seconds', 'HTTP 請求耗時', ('host',))
+
+_session = None
+_validators = None
+_lock = threading.Lock()
+
+
+# 取得共用的 Session，同一主機的請求會重複使用 keep-alive 連線
+def get_session():
+    global _session
+    with _lock:
+        if _session is None:
+            session = requests.Session()
+            # 重試用盡後仍回傳最後的回應（不丟出 RetryError），由呼叫端依狀態碼處理並計入 http_requests_total
+            retry = Retry(total=2, backoff_factor=0.5, status_forcelist=(502, 503, 504),
+                          allowed_methods=('GET', 'HEAD'), raise_on_status=False)
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE,
+                                  max_retries=retry)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+
+def _load_validators():
+    global _validators
+    if _validators is None:
+        try:
+            with open(HTTP_VALIDATORS_PATH, encoding='utf-8') as f:
+                _validators = json.load(f)
+        except (FileNotFoundError, ValueError):
+            _validators = {}
+        # 舊版檔案直接以網址為鍵，無法得知屬於哪個資料庫，捨棄
+        _validators = {scope: urls for scope, urls in _validators.items()
+                       if 'etag' not in urls and 'last_modified' not in urls}
+    return _validators
+
+
+# 發送 GET 請求；scope 有值時附上該來源上次記錄的 If-None-Match / If-Modified-Since
+def get(url, scope=None):
+    headers = {}
+    if scope is not None:
+        with _lock:
+            saved = _load_validators().get(scope, {}).get(url, {})
+        if 'etag' in saved:
+            headers['If-None-Match'] = saved['etag']
+        if 'last_modified' in saved:
+            headers['If-Modified-Since'] = saved['last_modified']
+    host = urlsplit(url).netloc
+    started = time.perf_counter()
+    try:
+        response = get_session().get(url, headers=headers,
+                                     timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+    except requests.RequestException:
+        _requests.inc(host=host, status='error')
+        raise
+    _seconds.observe(time.perf_counter() - started, host=host)
+    _requests.inc(host=host, status=str(response.status_code))
+    _bytes.inc(len(response.content), host=host)
+    response.encoding = 'utf-8'  # 設定編碼為UTF-8
+    return response
+
+
+# 頁面處理完成後才記錄其 ETag / Last-Modified，避免處理失敗的頁面下次被當成未變更而略過
+def remember(scope, url, response):
+    saved = {}
+    if response.headers.get('ETag'):
+        saved['etag'] = response.headers['ETag']
+    if response.headers.get('Last-Modified'):
+        saved['last_modified'] = response.headers['Last-Modified']
+    if not saved:
+        return
+    with _lock:
+        validators = _load_validators().setdefault(scope, {})
+        if validators.get(url) == saved:
+            return
+        validators[url] = saved
+        tmp_path = HTTP_VALIDATORS_PATH + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(_validators, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, HTTP_VALIDATORS_PATH)
@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+# 背景爬取工作的執行緒數與保留的已完成工作數
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_HISTORY = int(os.getenv('JOB_HISTORY', '100'))
+
+
+# 一個背景爬取工作的狀態與進度
+class Job:
+    def __init__(self, key, description):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.description = description
+        self.status = 'queued'
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.counters = {}
+        self.errors = []
+        self.messages = deque(maxlen=50)
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    @property
+    def active(self):
+        return self.status in ('queued', 'running')
+
+    # 等待工作結束（供排程器確認同一來源的爬取已完成）
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    # 傳給爬蟲的 log 函式，保留最近的訊息
+    def log(self, message):
+        with self._lock:
+            self.messages.append(str(message))
+        print(message)
+
+    # 傳給爬蟲的進度回報函式，例如 progress('inserted', 10)
+    def progress(self, name, count=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + count
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'id': self.id,
+                'description': self.description,
+                'status': self.status,
+                'submitted_at': self.submitted_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'progress': dict(self.counters),
+                'errors': list(self.errors),
+                'messages': list(self.messages),
+            }
+
+
+# 有上限的背景工作佇列；同一個 key 已有排隊中或執行中的工作時，新的提交會併入該工作
+class JobQueue:
+    def __init__(self, workers=JOB_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self._jobs = OrderedDict()
+        self._active = {}
+        self._lock = threading.Lock()
+
+    # func 會收到 Job 物件，可使用 job.log 與 job.progress 回報狀態
+    def submit(self, key, description, func):
+        with self._lock:
+            job = self._active.get(key)
+            if job is not None and job.active:
+                return job
+            job = Job(key, description)
+            self._active[key] = job
+            self._jobs[job.id] = job
+            self._trim()
+        self._executor.submit(self._run, job, func)
+        return job
+
+    def _run(self, job, func):
+        job.status = 'running'
+        job.started_at = time.time()
+        try:
+            func(job)
+            job.status = 'finished'
+        except Exception as err:
+            job.status = 'failed'
+            job.errors.append(f"{type(err).__name__}: {err}")
+            traceback.print_exc()
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                if self._active.get(job.key) is job:
+                    del self._active[job.key]
+            job._done.set()
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self._jobs.items() if not job.active]
+        for job_id in finished[:max(0, len(finished) - JOB_HISTORY)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+
+queue = JobQueue()
+
+
+# 在 Flask 應用程式上註冊工作狀態的 JSON 端點：/jobs 與 /jobs/<job_id>
+def register_routes(app):
+    from flask import jsonify
+
+    @app.route('/jobs')
+    def list_jobs():
+        return jsonify([job.to_dict() for job in queue.list()])
+
+    @app.route('/jobs/<job_id>')
+    def job_status(job_id):
+        job = queue.get(job_id)
+        if job is None:
+            return jsonify({'error': '找不到此工作'}), 404
+        return jsonify(job.to_dict())
+
+
+# 判斷請求是否希望取得 JSON 回應（而非重新導向回表單頁）
+def wants_json(request):
+    return request.accept_mimetypes.best == 'application/json'
@@ -0,0 +1,185 @@
+import sys
+
+from mysql.connector import errorcode
+
+import sources
+import storage
+
+# 資料表結構與版本管理：python migrate.py
+#
+# 每個版本只會執行一次，已套用的版本記錄在 schema_migrations。
+# 既有（由舊版程式建立）的資料表也能升級：補上 id、url_hash 與索引，並將日期轉為 DATE。
+
+
+def _column_type(cursor, table, column):
+    cursor.execute("SELECT DATA_TYPE FROM information_schema.COLUMNS "
+                   "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s",
+                   (table, column))
+    row = cursor.fetchone()
+    return row[0].lower() if row else None
+
+
+def _has_index(cursor, table, index):
+    cursor.execute("SELECT 1 FROM information_schema.STATISTICS "
+                   "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s LIMIT 1",
+                   (table, index))
+    return cursor.fetchone() is not None
+
+
+# 版本 1：建立資料表。url_hash 為網址的 SHA-256，以固定長度的 UNIQUE 索引去除重複
+def _create_tables(cursor, source):
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {source.table} ("
+        " id INT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,"
+        " title VARCHAR(500) NOT NULL,"
+        " date DATE NOT NULL,"
+        " url VARCHAR(1000) NOT NULL,"
+        " url_hash BINARY(32) NOT NULL,"
+        f" {source.body_column} MEDIUMTEXT,"
+        " UNIQUE KEY uq_url_hash (url_hash),"
+        " KEY idx_date_id (date, id)"
+        ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4")
+
+
+# 版本 2：升級舊版程式建立的資料表
+def _upgrade_legacy_tables(cursor, source):
+    table = source.table
+    if _column_type(cursor, table, 'id') is None:
+        cursor.execute(f"ALTER TABLE {table} "
+                       "ADD COLUMN id INT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY FIRST")
+
+    if _column_type(cursor, table, 'date') != 'date':
+        # 民國年（如 113-05-01）轉為西元年後再改為 DATE 型別
+        cursor.execute(f"UPDATE {table} SET date = CONCAT(CAST(SUBSTRING_INDEX(date, '-', 1) AS UNSIGNED) + 1911, "
+                       "SUBSTRING(date, LOCATE('-', date))) WHERE date REGEXP '^[0-9]{1,3}-'")
+        cursor.execute(f"UPDATE {table} SET date = '1970-01-01' WHERE STR_TO_DATE(date, '%Y-%m-%d') IS NULL")
+        cursor.execute(f"ALTER TABLE {table} MODIFY date DATE NOT NULL")
+
+    if _column_type(cursor, table, 'url_hash') is None:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN url_hash BINARY(32) NULL AFTER url")
+    cursor.execute(f"UPDATE {table} SET url_hash = UNHEX(SHA2(url, 256)) WHERE url_hash IS NULL")
+
+    if not _has_index(cursor, table, 'uq_url_hash'):
+        # 同一網址保留最早的一筆，其餘刪除後才能建立 UNIQUE 索引
+        cursor.execute(f"DELETE t1 FROM {table} t1 JOIN {table} t2 "
+                       "ON t1.url_hash = t2.url_hash AND t1.id > t2.id")
+        cursor.execute(f"ALTER TABLE {table} MODIFY url_hash BINARY(32) NOT NULL, "
+                       "ADD UNIQUE KEY uq_url_hash (url_hash)")
+    if not _has_index(cursor, table, 'idx_date_id'):
+        cursor.execute(f"ALTER TABLE {table} ADD KEY idx_date_id (date, id)")
+
+
+# 版本 3：內文指紋、上次重新檢查的時間與修訂歷史表
+def _add_revisions(cursor, source):
+    table = source.table
+    if _column_type(cursor, table, 'content_hash') is None:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN content_hash BINARY(32) NULL, "
+                       "ADD COLUMN checked_at DATETIME NULL")
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {table}_revisions ("
+        " id INT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,"
+        " report_id INT UNSIGNED NOT NULL,"
+        " title VARCHAR(500) NOT NULL,"
+        f" {source.body_column} MEDIUMTEXT,"
+        " content_hash BINARY(32) NULL,"
+        " replaced_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,"
+        " KEY idx_report_id (report_id)"
+        ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4")
+
+
+# 版本 4：壓縮儲存內文用的欄位與共用字典表（見 body_codec）
+def _add_compressed_bodies(cursor, source):
+    cursor.execute("CREATE TABLE IF NOT EXISTS body_dictionaries ("
+                   " id INT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,"
+                   " algorithm VARCHAR(10) NOT NULL,"
+                   " data MEDIUMBLOB NOT NULL,"
+                   " created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP)")
+    for table in (source.table, f"{source.table}_revisions"):
+        if _column_type(cursor, table, source.compressed_column) is None:
+            cursor.execute(f"ALTER TABLE {table} MODIFY {source.body_column} MEDIUMTEXT NULL, "
+                           f"ADD COLUMN {source.compressed_column} MEDIUMBLOB NULL AFTER {source.body_column}")
+
+
+MIGRATIONS = [
+    (1, '建立資料表', _create_tables),
+    (2, '升級舊版資料表：id、url_hash 唯一索引與 DATE 型別', _upgrade_legacy_tables),
+    (3, '內文指紋與修訂歷史', _add_revisions),
+    (4, '內文壓縮儲存欄位與字典表', _add_compressed_bodies),
+]
+
+
+# 目前程式寫入資料時需要的結構版本（url_hash、content_hash 與壓縮內文欄位）
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# 已確認為最新結構的連線設定，同一行程中不再重複查詢
+_checked = set()
+
+
+class SchemaError(RuntimeError):
+    pass
+
+
+# 確認資料庫已套用所有版本；爬取與重新檢查開始前呼叫，避免寫入時才因缺少欄位而失敗。
+# SQLite 與其他後端的資料表依目前的結構建立，不需檢查
+def check_schema(config):
+    if storage.backend_name(config) != 'mysql':
+        return
+    key = storage.config_key(config)
+    if key in _checked:
+        return
+    with storage.connection(config) as cnx:
+        cursor = cnx.cursor()
+        try:
+            cursor.execute("SELECT version FROM schema_migrations")
+            done = {version for (version,) in cursor.fetchall()}
+        except storage.DB_ERRORS as err:
+            if getattr(err, 'errno', None) != errorcode.ER_NO_SUCH_TABLE:
+                raise
+            done = set()  # 從未執行過 migrate.py
+        finally:
+            cursor.close()
+    missing = [version for version, _, _ in MIGRATIONS if version not in done]
+    if missing:
+        raise SchemaError(f"資料表結構尚未升級（缺少版本 {', '.join(map(str, missing))}，"
+                          f"需要版本 {SCHEMA_VERSION}），請先執行 python migrate.py")
+    _checked.add(key)
+
+
+# 依序套用尚未執行的版本，回傳本次套用的版本清單
+def migrate(config, log=print):
+    if storage.backend_name(config) == 'sqlite':
+        log("SQLite 的資料表於第一次連線時依目前的結構建立，不需升級")
+        return []
+    applied = []
+    with storage.connection(config) as cnx:
+        cursor = cnx.cursor()
+        cursor.execute("CREATE TABLE IF NOT EXISTS schema_migrations ("
+                       " version INT NOT NULL PRIMARY KEY,"
+                       " description VARCHAR(200) NOT NULL,"
+                       " applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP)")
+        cursor.execute("SELECT version FROM schema_migrations")
+        done = {version for (version,) in cursor.fetchall()}
+        for version, description, func in MIGRATIONS:
+            if version in done:
+                continue
+            log(f"套用版本 {version}: {description}")
+            for source in sources.SOURCES.values():
+                func(cursor, source)
+            cursor.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                           (version, description))
+            cnx.commit()
+            applied.append(version)
+        cursor.close()
+    _checked.discard(storage.config_key(config))
+    if not applied:
+        log("資料表結構已是最新版本")
+    return applied
+
+
+if __name__ == '__main__':
+    config = storage.env_config()
+    try:
+        migrate(config)
+    except storage.DB_ERRORS as err:
+        print(f"Error: {err}")
+        sys.exit(1)
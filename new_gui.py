@@ -1,13 +1,8 @@
-import requests
-from bs4 import BeautifulSoup
-import mysql.connector
-from mysql.connector import errorcode
 import os
-import schedule
-import time
-import tkinter as tk
-from tkinter import messagebox
-from tkinter import simpledialog
+import threading
+
+# 匯入本模組時不做任何 I/O：爬蟲（requests、bs4、mysql.connector）、排程器與 tkinter
+# 都在第一次使用時才載入，視窗先顯示，初次爬取在背景開始
 
 # 從環境變數中讀取資料庫連線資訊和爬取間隔
 DB_USER = os.getenv('DB_USER', 'root')
@@ -25,112 +20,47 @@ config = {
     'raise_on_warnings': True
 }
 
-# 檢查資料是否已存在的函式
-def data_exists(title, date, url):
-    try:
-        cnx = mysql.connector.connect(**config)
-        cursor = cnx.cursor()
-        
-        query = ("SELECT COUNT(*) FROM control_yuan_reports "
-                 "WHERE title = %s AND date = %s AND url = %s")
-        cursor.execute(query, (title, date, url))
-        count = cursor.fetchone()[0]
-        
-        cursor.close()
-        cnx.close()
-        return count > 0
-    
-    except mysql.connector.Error as err:
-        print(f"Error: {err}")
-        return False
-
-# 插入資料的函式，防止SQL注入
-def insert_data(title, date, url, content):
-    try:
-        cnx = mysql.connector.connect(**config)
-        cursor = cnx.cursor()
-
-        add_data = ("INSERT INTO control_yuan_reports "
-                    "(title, date, url, content) "
-                    "VALUES (%s, %s, %s, %s)")
-        data = (title, date, url, content)
-
-        cursor.execute(add_data, data)
-        cnx.commit()
-
-        cursor.close()
-        cnx.close()
-        print(f"資料已成功插入: {title}")
-    
-    except mysql.connector.Error as err:
-        if err.errno == errorcode.ER_ACCESS_DENIED_ERROR:
-            print("使用者名稱或密碼錯誤")
-        elif err.errno == errorcode.ER_BAD_DB_ERROR:
-            print("資料庫不存在")
-        else:
-            print(err)
-
-# 爬取給定的URL
-def fetch_page_content(url):
-    response = requests.get(url)
-    response.encoding = 'utf-8'  # 設定編碼為UTF-8
-    return response.text
-
-# 提取內文與相關連結
-def extract_content_and_links(html_content):
-    soup = BeautifulSoup(html_content, 'html.parser')
-    # 提取內文
-    content_div = soup.find('div', class_='area-essay page-caption-p')
-    content_text = content_div.get_text(strip=True, separator='\n') if content_div else 'No content found'
-    return content_text
-
 # 定義函式來爬取指定頁數的新聞稿
 def crawl_news(pages):
-    base_url = 'https://www.cy.gov.tw/News.aspx?_CSN=129&n=792&page={}&PageSize=100&sms=8912&Create=1'
-
-    for page in range(1, pages + 1):
-        url = base_url.format(page)
-        response = requests.get(url)
-        response.encoding = 'utf-8'
-
-        soup = BeautifulSoup(response.text, 'html.parser')
-        news_list = soup.select('table tbody tr')
-
-        for news in news_list:
-            date = news.find('span').text.strip()
-            title = news.find('a').text.strip()
-            link = news.find('a')['href']
-            news_url = 'https://www.cy.gov.tw/' + link
-            html_content = fetch_page_content(news_url)
-            content_text = extract_content_and_links(html_content)
-            
-            # 檢查資料是否已存在，若不存在則插入資料
-            if not data_exists(title, date, news_url):
-                insert_data(title, date, news_url, content_text)
-            else:
-                print(f"資料已存在: {title}")
-                return  # 停止函式執行
+    import crawler
+    crawler.crawl_news(pages, config)
 
 # 定期爬取新聞稿的函式
 def scheduled_crawl():
     crawl_news(5)
 
-# 立即執行一次爬取
-scheduled_crawl()
-
-# 使用 schedule 設定定期任務
-schedule.every(CRAWL_INTERVAL_DAYS).days.do(scheduled_crawl)
-
-print(f"定期爬取任務已設定，每 {CRAWL_INTERVAL_DAYS} 天執行一次")
-
-# 開始任務調度
-def run_scheduler():
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+crawl_scheduler = None
+_scheduler_lock = threading.Lock()
+
+# 第一次使用時才建立並啟動排程器
+def get_scheduler():
+    global crawl_scheduler
+    with _scheduler_lock:
+        if crawl_scheduler is None:
+            import scheduler
+            crawl_scheduler = scheduler.Scheduler()
+            crawl_scheduler.start()
+        return crawl_scheduler
+
+# 定期任務：排程執行緒睡到到期時間才醒來，在背景爬取；從未爬取過此資料庫時，immediate 為真則立即執行一次
+def schedule_crawl(immediate=True):
+    import crawl_state
+    import sources
+    get_scheduler().add('cy', CRAWL_INTERVAL_DAYS * 86400, scheduled_crawl,
+                        crawl_state.source_key(config, sources.CONTROL_YUAN.table), immediate=immediate)
+    print(f"定期爬取任務已設定，每 {CRAWL_INTERVAL_DAYS} 天執行一次")
+
+# 以新的設定重新排程並立即爬取一次（已在爬取中則不重複）；
+# 排程時不立即執行，否則排程執行緒先開始爬取後，run_now 會讓同一次設定再爬取一次
+def restart_crawl():
+    schedule_crawl(immediate=False)
+    get_scheduler().run_now('cy')
 
 # GUI 設定
 def setup_gui():
+    import tkinter as tk
+    from tkinter import messagebox
+
     def start_crawling():
         global DB_USER, DB_PASSWORD, DB_HOST, DB_NAME, CRAWL_INTERVAL_DAYS
         DB_USER = user_entry.get()
@@ -148,8 +78,14 @@ def setup_gui():
         })
         
         messagebox.showinfo("Info", "設定成功，開始爬取新聞稿")
-        scheduled_crawl()
-        run_scheduler()
+        # 載入爬蟲與排程都在背景執行緒進行，視窗不會被阻擋
+        threading.Thread(target=restart_crawl, daemon=True).start()
+
+    # 關閉視窗時停止排程，不再開始新的爬取
+    def on_close():
+        if crawl_scheduler is not None:
+            crawl_scheduler.stop(wait=False)
+        root.destroy()
 
     root = tk.Tk()
     root.title("新聞爬取工具")
@@ -181,7 +117,11 @@ def setup_gui():
     start_button = tk.Button(root, text="開始爬取", command=start_crawling)
     start_button.pack(pady=20)
 
+    root.protocol("WM_DELETE_WINDOW", on_close)
+    # 視窗顯示後才在背景載入爬蟲並排定初次爬取
+    root.after_idle(lambda: threading.Thread(target=schedule_crawl, daemon=True).start())
     root.mainloop()
 
 # 初始化 GUI
-setup_gui()
+if __name__ == '__main__':
+    setup_gui()
@@ -0,0 +1,195 @@
+import html as html_lib
+import os
+import re
+import sys
+
+# HTML 解析後端：bs4（預設，html.parser 並只建構目標區塊）、lxml、selectolax
+HTML_PARSER = os.getenv('HTML_PARSER', 'bs4')
+
+# 與原本 BeautifulSoup(html, 'html.parser').find(...).get_text(strip=True, separator='\n') 的已知差異：
+#   - 錯誤巢狀的標籤（如 <p>x<div>y</p>z</div>）由 lxml（libxml2）建構的樹不同：多餘的結束標籤被忽略，
+#     相鄰文字合併為同一段，輸出的換行位置會不同（y、z 成為 yz）。selectolax 與 html.parser 一致。
+#   - <![CDATA[...]]> 在 HTML 中會被 lxml 與 selectolax 當成註解丟棄，html.parser 則保留為文字；
+#     這兩個後端解析前先將 CDATA 區段轉為一般文字，輸出與 html.parser 相同。
+# 比對的測試見 tests/test_parsing.py。
+#
+# BeautifulSoup 的 get_text 不會輸出這些標籤內的文字（script、style 等），其他後端比照辦理
+_SKIP_TEXT_TAGS = frozenset(('script', 'style', 'template', 'rt', 'rp'))
+
+
+class _Bs4Node:
+    def __init__(self, tag):
+        self._tag = tag
+
+    def select(self, css):
+        return [_Bs4Node(tag) for tag in self._tag.select(css)]
+
+    def select_one(self, css):
+        tag = self._tag.select_one(css)
+        return _Bs4Node(tag) if tag is not None else None
+
+    @property
+    def text(self):
+        return self._tag.text
+
+    def get_text(self):
+        return self._tag.get_text(strip=True, separator='\n')
+
+    def __getitem__(self, name):
+        return self._tag[name]
+
+
+class _LxmlNode:
+    def __init__(self, element):
+        self._element = element
+
+    def select(self, css):
+        return [_LxmlNode(el) for el in _lxml_selector(css)(self._element)]
+
+    def select_one(self, css):
+        found = _lxml_selector(css)(self._element)
+        return _LxmlNode(found[0]) if found else None
+
+    def _strings(self):
+        def walk(element):
+            if element.tag in _SKIP_TEXT_TAGS:
+                return
+            if element.text:
+                yield element.text
+            for child in element:
+                if isinstance(child.tag, str):  # 略過註解與處理指令，但保留其後的文字
+                    yield from walk(child)
+                if child.tail:
+                    yield child.tail
+        return walk(self._element)
+
+    @property
+    def text(self):
+        return ''.join(self._strings())
+
+    def get_text(self):
+        return '\n'.join(s.strip() for s in self._strings() if s.strip())
+
+    def __getitem__(self, name):
+        return self._element.attrib[name]
+
+
+class _SelectolaxNode:
+    def __init__(self, node):
+        self._node = node
+
+    def select(self, css):
+        return [_SelectolaxNode(node) for node in self._node.css(css)]
+
+    def select_one(self, css):
+        node = self._node.css_first(css)
+        return _SelectolaxNode(node) if node is not None else None
+
+    def _strings(self):
+        for node in self._node.traverse(include_text=True):
+            if node.tag != '-text':
+                continue
+            parent = node.parent
+            while parent is not None and parent.tag not in _SKIP_TEXT_TAGS and parent.mem_id != self._node.mem_id:
+                parent = parent.parent
+            if parent is not None and parent.tag in _SKIP_TEXT_TAGS:
+                continue
+            yield node.text_content
+
+    @property
+    def text(self):
+        return ''.join(self._strings())
+
+    def get_text(self):
+        return '\n'.join(s.strip() for s in self._strings() if s.strip())
+
+    def __getitem__(self, name):
+        value = self._node.attributes[name]
+        if value is None:
+            raise KeyError(name)
+        return value
+
+
+_lxml_selectors = {}
+
+
+def _lxml_selector(css):
+    selector = _lxml_selectors.get(css)
+    if selector is None:
+        from lxml.cssselect import CSSSelector
+        selector = _lxml_selectors[css] = CSSSelector(css, translator='html')
+    return selector
+
+
+_CDATA = re.compile(r'<!\[CDATA\[(.*?)\]\]>', re.S)
+
+
+# 將 CDATA 區段改寫為跳脫後的文字，讓 lxml 與 selectolax 與 html.parser 一樣保留其內容；
+# 前後加上空註解，使其與相鄰文字仍是分開的字串（get_text 以換行分隔）
+def _unwrap_cdata(html):
+    if isinstance(html, bytes) or '<![CDATA[' not in html:
+        return html
+    return _CDATA.sub(lambda match: '<!---->' + html_lib.escape(match.group(1), quote=False) + '<!---->', html)
+
+
+# 由選擇器的第一段（如 div.area-essay、div[class="a b"]、table）取出 bs4 可用的篩選條件
+def _strainer(css):
+    from bs4 import SoupStrainer
+    match = re.match(r'([\w-]+)(?:\.([\w-]+)|\[class="([^"]+)"\])?', css.strip())
+    if match is None:
+        return None
+    name, token, exact = match.groups()
+    if exact:
+        return SoupStrainer(name, class_=exact)
+    if token:
+        # 比對 class 清單中的任一項，與 find(class_=...) 相同
+        return SoupStrainer(name, class_=lambda value: value is not None and token in value.split())
+    return SoupStrainer(name)
+
+
+# 解析 HTML；指定 target 選擇器時，bs4 後端只建構符合其第一段的區塊以節省時間
+def parse(html, target=None, backend=None):
+    backend = backend or HTML_PARSER
+    if backend == 'bs4':
+        from bs4 import BeautifulSoup
+        strainer = _strainer(target) if target else None
+        return _Bs4Node(BeautifulSoup(html, 'html.parser', parse_only=strainer))
+    if backend == 'lxml':
+        import lxml.html
+        from lxml.etree import ParserError
+        try:
+            return _LxmlNode(lxml.html.document_fromstring(_unwrap_cdata(html)))
+        except ParserError:  # 空白文件
+            return _LxmlNode(lxml.html.fromstring('<html></html>'))
+    if backend == 'selectolax':
+        from selectolax.lexbor import LexborHTMLParser
+        return _SelectolaxNode(LexborHTMLParser(_unwrap_cdata(html)).root)
+    raise ValueError(f"未知的 HTML 解析後端: {backend}")
+
+
+# 取出第一個符合 css 的區塊文字，等同 get_text(strip=True, separator='\n')；找不到時回傳 None
+def extract_text(html, css, backend=None):
+    node = parse(html, css, backend).select_one(css)
+    return node.get_text() if node is not None else None
+
+
+# 比對各後端與完整 html.parser 樹的輸出是否一致：python parsing.py <css> <file.html> ...
+if __name__ == '__main__':
+    css, paths = sys.argv[1], sys.argv[2:]
+    mismatches = 0
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            html = f.read()
+        node = parse(html, backend='bs4').select_one(css)
+        expected = node.get_text() if node is not None else None
+        for backend in ('bs4', 'lxml', 'selectolax'):
+            try:
+                actual = extract_text(html, css, backend=backend)
+            except ImportError as err:
+                print(f"{backend}: 未安裝 ({err})")
+                continue
+            if actual != expected:
+                mismatches += 1
+                print(f"不一致: {path} ({backend})")
+    print(f"比對完成，共 {mismatches} 筆不一致")
+    sys.exit(1 if mismatches else 0)
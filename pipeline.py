@@ -0,0 +1,199 @@
+import os
+import queue
+import threading
+import time
+
+# 各階段之間佇列的預設容量，限制同時在記憶體中的項目數
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', '50'))
+
+_DONE = object()
+_DROPPED = object()
+
+_listeners = []
+
+
+# 註冊觀察各階段處理時間的函式，呼叫方式為 func(管線名稱, 階段名稱, 秒數, 筆數)；
+# 寫入端（sink）的階段名稱為 'sink'。供基準測試與監控使用
+def add_listener(func):
+    _listeners.append(func)
+
+
+def remove_listener(func):
+    _listeners.remove(func)
+
+
+def _notify(pipe_name, stage_name, seconds, count):
+    for func in list(_listeners):
+        func(pipe_name, stage_name, seconds, count)
+
+
+# 在各階段間原封不動傳遞的標記，寫入端會依序收到（例如一整頁列表處理完畢）
+class Marker:
+    def __init__(self, value):
+        self.value = value
+
+
+# batch_size 大於 1 時，func 會收到最多 batch_size 筆項目的清單，並須依序回傳同樣筆數的結果
+class Stage:
+    def __init__(self, name, func, workers=1, queue_size=PIPELINE_QUEUE_SIZE, batch_size=1):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.processed = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+        self._running = 0
+
+    def stats(self):
+        with self._lock:
+            return {'stage': self.name, 'workers': self.workers, 'queued': self.queue.qsize(),
+                    'processed': self.processed, 'busy_seconds': round(self.busy_seconds, 3)}
+
+
+# 以有界佇列串接的多階段管線：producer 依序產生項目，經過各 Stage 處理後，
+# 由 sink 依原本順序接收，結束時再呼叫 flush。任何階段都可以呼叫 cancel() 讓上游停止並丟棄尚未處理的項目。
+class Pipeline:
+    def __init__(self, name, producer, stages, sink, flush=None):
+        self.name = name
+        self.producer = producer
+        self.stages = stages
+        self.sink = sink
+        self.flush = flush
+        self.produced = 0
+        self.error = None
+        self._cancelled = threading.Event()
+        self._sink_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def _fail(self, err):
+        if self.error is None:
+            self.error = err
+        self.cancel()
+
+    # 放入佇列；管線取消時放棄等待，避免阻塞在已滿的佇列上
+    def _put(self, q, item, force=False):
+        while True:
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                if self.cancelled and not force:
+                    return False
+
+    def _produce(self):
+        first = self.stages[0].queue if self.stages else self._sink_queue
+        seq = 0
+        try:
+            for item in self.producer(self):
+                if self.cancelled or not self._put(first, (seq, item)):
+                    break
+                seq += 1
+        except Exception as err:
+            self._fail(err)
+        finally:
+            self.produced = seq
+            for _ in range(self.stages[0].workers if self.stages else 1):
+                self._put(first, _DONE, force=True)
+
+    # 取出下一批項目：先阻塞等待第一筆，再於不等待的情況下湊滿 batch_size 筆
+    def _take(self, stage):
+        batch = [stage.queue.get()]
+        while len(batch) < stage.batch_size and batch[-1] is not _DONE:
+            try:
+                batch.append(stage.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _work(self, index):
+        stage = self.stages[index]
+        out = self.stages[index + 1].queue if index + 1 < len(self.stages) else self._sink_queue
+        done = False
+        while not done:
+            batch = self._take(stage)
+            if batch[-1] is _DONE:
+                batch.pop()
+                done = True
+            work = [i for i, (_, payload) in enumerate(batch) if not isinstance(payload, Marker)]
+            if work:
+                results = [_DROPPED] * len(work)
+                if not self.cancelled:  # 取消後不再處理，但保留序號讓下游維持順序
+                    started = time.perf_counter()
+                    try:
+                        if stage.batch_size > 1:
+                            results = list(stage.func([batch[i][1] for i in work]))
+                        else:
+                            results = [stage.func(batch[work[0]][1])]
+                    except Exception as err:
+                        self._fail(err)
+                    elapsed = time.perf_counter() - started
+                    with stage._lock:
+                        stage.busy_seconds += elapsed
+                        stage.processed += len(work)
+                    _notify(self.name, stage.name, elapsed, len(work))
+                for i, result in zip(work, results):
+                    batch[i] = (batch[i][0], result)
+            for item in batch:
+                self._put(out, item, force=True)
+        with stage._lock:
+            stage._running -= 1
+            last = stage._running == 0
+        if last:
+            next_workers = self.stages[index + 1].workers if index + 1 < len(self.stages) else 1
+            for _ in range(next_workers):
+                self._put(out, _DONE, force=True)
+
+    # 依序號重新排序後交給 sink；遇到被取消或失敗的項目後，其後的項目一律捨棄
+    def _drain(self):
+        pending = {}
+        expected = 0
+        dropped = False
+        while True:
+            item = self._sink_queue.get()
+            if item is _DONE:
+                break
+            seq, payload = item
+            pending[seq] = payload
+            while expected in pending:
+                payload = pending.pop(expected)
+                expected += 1
+                if payload is _DROPPED:
+                    dropped = True
+                if dropped:
+                    continue
+                started = time.perf_counter()
+                try:
+                    self.sink(payload)
+                except Exception as err:
+                    self._fail(err)
+                    dropped = True
+                _notify(self.name, 'sink', time.perf_counter() - started, 1)
+
+    def stats(self):
+        return [stage.stats() for stage in self.stages]
+
+    # 執行管線直到所有項目處理完畢或被取消；若有階段發生例外，於結束後拋出
+    def run(self):
+        threads = [threading.Thread(target=self._produce, name=f"{self.name}-producer", daemon=True)]
+        for index, stage in enumerate(self.stages):
+            stage._running = stage.workers
+            for n in range(stage.workers):
+                threads.append(threading.Thread(target=self._work, args=(index,),
+                                                name=f"{self.name}-{stage.name}-{n}", daemon=True))
+        for thread in threads:
+            thread.start()
+        self._drain()
+        for thread in threads:
+            thread.join()
+        if self.flush is not None:
+            self.flush()
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,218 @@
+import cProfile
+import hmac
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+# 爬取效能分析：以 CRAWL_PROFILE 環境變數、crawler.py --profile 或 POST /admin/profile 開啟。
+#   cprofile  決定式分析，輸出 <名稱>-<時間>.pstats（python -m pstats 或 snakeviz 檢視）
+#             Python 3.12 起只分析呼叫 profile() 的執行緒，其他執行緒請搭配 sample
+#   sample    每 CRAWL_PROFILE_INTERVAL 秒取樣所有執行緒的呼叫堆疊，輸出 .collapsed（flamegraph.pl / speedscope 可讀）
+#   all       兩者同時進行
+# CRAWL_PROFILE_TRACEMALLOC=1 時另外記錄執行前後的記憶體配置差異，依檔案彙總（可看出下載、解析、寫入各佔多少），
+# 輸出 .tracemalloc.txt。未開啟時 profile() 只檢查一次設定，不會有其他負擔。
+CRAWL_PROFILE = os.getenv('CRAWL_PROFILE', '')
+CRAWL_PROFILE_DIR = os.getenv('CRAWL_PROFILE_DIR', 'profiles')
+CRAWL_PROFILE_INTERVAL = float(os.getenv('CRAWL_PROFILE_INTERVAL', '0.005'))
+CRAWL_PROFILE_TRACEMALLOC = os.getenv('CRAWL_PROFILE_TRACEMALLOC', '0') == '1'
+# /admin/profile 需在 X-Admin-Token 標頭帶入此值；未設定時停用該端點
+PROFILE_ADMIN_TOKEN = os.getenv('PROFILE_ADMIN_TOKEN', '')
+
+MODES = ('cprofile', 'sample', 'all')
+
+_once = None
+_active = threading.Lock()
+_state_lock = threading.Lock()
+
+
+# 只分析下一次執行（供 CLI 參數與管理端點使用）
+def request_once(mode='all', trace_memory=None):
+    global _once
+    if mode not in MODES:
+        raise ValueError(f"未知的分析模式: {mode}")
+    with _state_lock:
+        _once = (mode, CRAWL_PROFILE_TRACEMALLOC if trace_memory is None else trace_memory)
+
+
+def _take_request():
+    global _once
+    with _state_lock:
+        if _once is not None:
+            request, _once = _once, None
+            return request
+    if CRAWL_PROFILE:
+        return ('all' if CRAWL_PROFILE == '1' else CRAWL_PROFILE), CRAWL_PROFILE_TRACEMALLOC
+    return None
+
+
+# 取樣式分析：定期讀取所有執行緒目前的呼叫堆疊並累計次數
+class _Sampler(threading.Thread):
+    def __init__(self, interval):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        me = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+# 決定式分析：本執行緒與分析期間新建立的執行緒各自掛上 cProfile，結束後合併。
+# Python 3.12 起 cProfile 改以 sys.monitoring 實作，同一行程同時只能啟用一個 profiler，
+# 在其他執行緒再啟用會丟出 ValueError 並讓該執行緒結束；因此只分析呼叫端執行緒，其他執行緒以 sample 模式涵蓋
+_PER_THREAD_PROFILES = sys.version_info < (3, 12)
+
+
+class _ThreadProfiles:
+    def __init__(self):
+        self.profilers = []
+        self._lock = threading.Lock()
+
+    def _hook(self, frame, event, arg):
+        sys.setprofile(None)
+        target = getattr(threading.current_thread(), '_target', None)
+        # 執行緒池的執行緒會常駐，不掛上 profiler，避免分析結束後仍有額外負擔
+        if target is not None and getattr(target, '__module__', '') == 'concurrent.futures.thread':
+            return
+        profiler = cProfile.Profile()
+        with self._lock:
+            self.profilers.append(profiler)
+        profiler.enable()
+
+    def start(self):
+        main = cProfile.Profile()
+        self.profilers.append(main)
+        if _PER_THREAD_PROFILES:
+            threading.setprofile(self._hook)
+        main.enable()
+
+    def stop(self, path):
+        import pstats
+        if _PER_THREAD_PROFILES:
+            threading.setprofile(None)
+        self.profilers[0].disable()
+        with self._lock:
+            profilers = list(self.profilers)
+        stats = pstats.Stats(profilers[0])
+        for profiler in profilers[1:]:
+            profiler.disable()
+            try:
+                stats.add(profiler)
+            except TypeError:  # 尚未記錄任何呼叫的執行緒
+                pass
+        stats.dump_stats(path)
+
+
+def _write_tracemalloc(before, after, peak, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"peak traced memory: {peak / 1024:.1f} KB\n\n依檔案彙總的配置差異:\n")
+        for stat in after.compare_to(before, 'filename')[:30]:
+            f.write(f"{stat}\n")
+        f.write("\n依程式行彙總的配置差異:\n")
+        for stat in after.compare_to(before, 'lineno')[:30]:
+            f.write(f"{stat}\n")
+
+
+# 分析 with 區塊內的執行；未開啟或已有其他分析在進行時不做任何事
+@contextmanager
+def profile(name, log=print):
+    if _once is None and not CRAWL_PROFILE:
+        yield
+        return
+    # 先確認沒有其他分析在進行才取出一次性的請求；否則巢狀的 profile()（如 scheduled_crawl 內的 crawl_all）
+    # 或同時進行的爬取會取走請求卻不分析，請求就此遺失
+    if not _active.acquire(blocking=False):
+        yield
+        return
+    request = _take_request()
+    if request is None:
+        _active.release()
+        yield
+        return
+    mode, trace_memory = request
+    os.makedirs(CRAWL_PROFILE_DIR, exist_ok=True)
+    base = os.path.join(CRAWL_PROFILE_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}")
+    sampler = _Sampler(CRAWL_PROFILE_INTERVAL) if mode in ('sample', 'all') else None
+    profiles = _ThreadProfiles() if mode in ('cprofile', 'all') else None
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    try:
+        if trace_memory:
+            if started_tracing:
+                tracemalloc.start(10)
+            tracemalloc.reset_peak()
+            before = tracemalloc.take_snapshot()
+        if sampler is not None:
+            sampler.start()
+        if profiles is not None:
+            profiles.start()
+        yield
+    finally:
+        outputs = []
+        if trace_memory:
+            # 先取快照，避免輸出分析結果時的配置被算進去
+            after = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            if started_tracing:
+                tracemalloc.stop()
+        if profiles is not None:
+            profiles.stop(base + '.pstats')
+            outputs.append(base + '.pstats')
+        if sampler is not None:
+            sampler.stop()
+            with open(base + '.collapsed', 'w', encoding='utf-8') as f:
+                for stack, count in sampler.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            outputs.append(base + '.collapsed')
+        if trace_memory:
+            _write_tracemalloc(before, after, peak, base + '.tracemalloc.txt')
+            outputs.append(base + '.tracemalloc.txt')
+        _active.release()
+        log(f"效能分析結果: {', '.join(outputs)}")
+
+
+# 在 Flask 應用程式上註冊管理端點：POST /admin/profile 讓下一次爬取進行分析，GET 列出已產生的檔案。
+# 未設定 PROFILE_ADMIN_TOKEN 時端點回應 404，不會在未驗證的情況下開放
+def register_routes(app):
+    from flask import jsonify, request
+
+    @app.route('/admin/profile', methods=['GET', 'POST'])
+    def admin_profile():
+        if not PROFILE_ADMIN_TOKEN:
+            return jsonify({'error': '未啟用（需設定 PROFILE_ADMIN_TOKEN）'}), 404
+        if not hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode('utf-8'),
+                                   PROFILE_ADMIN_TOKEN.encode('utf-8')):
+            return jsonify({'error': '未授權'}), 403
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or request.form
+            mode = data.get('mode', 'all')
+            trace_memory = str(data.get('tracemalloc', '')).lower() in ('1', 'true')
+            try:
+                request_once(mode, trace_memory or None)
+            except ValueError as err:
+                return jsonify({'error': str(err)}), 400
+            return jsonify({'status': 'armed', 'mode': mode, 'directory': CRAWL_PROFILE_DIR}), 202
+        try:
+            files = sorted(os.listdir(CRAWL_PROFILE_DIR))
+        except FileNotFoundError:
+            files = []
+        return jsonify({'directory': CRAWL_PROFILE_DIR, 'files': files})
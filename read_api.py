@@ -0,0 +1,244 @@
+import base64
+import datetime
+import json
+import os
+
+import body_codec
+import export
+import result_cache
+import search
+import storage
+
+# 已儲存資料的唯讀 JSON API：
+#   GET /api/<來源>?limit=50&cursor=...&fields=title,date,url&since=2024-01-01&until=2024-12-31
+#   GET /api/<來源>/<id>?fields=title,statement
+#   GET /api/<來源>/search?q=人權 監獄&limit=20
+#   GET /api/<來源>/export?format=csv&since=2024-01-01&until=2024-12-31&incremental=analyst
+#   POST /api/<來源>/export?format=csv&incremental=analyst
+# 列表依 (date, id) 由新到舊排列，以上一頁最後一筆的 (date, id) 作為游標（keyset 分頁），
+# 不使用 OFFSET，翻到後面的頁數也只需掃描該頁的資料。
+READ_API_DEFAULT_LIMIT = int(os.getenv('READ_API_DEFAULT_LIMIT', '50'))
+READ_API_MAX_LIMIT = int(os.getenv('READ_API_MAX_LIMIT', '1000'))
+# 筆數不超過此值的回應會整份放入結果快取；更大的回應則邊讀邊串流輸出
+READ_API_CACHE_ROWS = int(os.getenv('READ_API_CACHE_ROWS', '200'))
+
+_FETCH_SIZE = 100
+
+
+class _BadRequest(Exception):
+    pass
+
+
+def _json_value(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', 'replace')
+    return value
+
+
+def _encode_cursor(date, item_id):
+    raw = f"{_json_value(date)},{item_id}".encode('ascii')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('ascii')
+        date, item_id = raw.split(',')
+        return datetime.date.fromisoformat(date), int(item_id)
+    except (ValueError, UnicodeDecodeError):
+        raise _BadRequest('cursor 格式錯誤')
+
+
+def _parse_date(value, name):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise _BadRequest(f"{name} 須為 YYYY-MM-DD 格式")
+
+
+# 解析 fields 參數，只允許資料表中實際存在的欄位
+def _parse_fields(source, value, default):
+    allowed = ('id',) + source.columns
+    if not value:
+        return list(default)
+    fields = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in allowed]
+    if unknown:
+        raise _BadRequest(f"不支援的欄位: {', '.join(unknown)}（可用欄位: {', '.join(allowed)}）")
+    return list(dict.fromkeys(fields))
+
+
+def _parse_limit(value):
+    try:
+        limit = int(value) if value else READ_API_DEFAULT_LIMIT
+    except ValueError:
+        raise _BadRequest('limit 須為整數')
+    if limit < 1:
+        raise _BadRequest('limit 須大於 0')
+    return min(limit, READ_API_MAX_LIMIT)
+
+
+# 組出列表查詢；date 與 id 一律查出以產生下一頁的游標，多取一筆用來判斷是否還有下一頁
+def _list_query(source, fields, limit, after, since, until):
+    columns = list(dict.fromkeys(fields + ['date', 'id']))
+    if source.body_column in fields:
+        columns.append(source.compressed_column)  # 壓縮儲存的內文，讀出後解壓縮
+    where = []
+    params = []
+    if after is not None:
+        # 展開成以 date 為前綴的範圍條件，才能使用 idx_date_id 索引
+        date, item_id = after
+        where.append("date <= %s AND (date < %s OR id < %s)")
+        params += [date, date, item_id]
+    if since is not None:
+        where.append("date >= %s")
+        params.append(since)
+    if until is not None:
+        where.append("date <= %s")
+        params.append(until)
+    query = f"SELECT {', '.join(columns)} FROM {source.table}"
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    query += " ORDER BY date DESC, id DESC LIMIT %s"
+    params.append(limit + 1)
+    return columns, query, params
+
+
+# 以不緩衝的游標分批讀出查詢結果，邊讀邊產生 JSON 片段，不必一次載入整頁資料
+def _stream_list(config, source, fields, columns, query, params, limit):
+    yield '{"items": ['
+    last = None
+    count = 0
+    more = False
+    if source.compressed_column in columns:
+        body_codec.preload(config)
+    with storage.connection(config) as cnx:
+        cursor = cnx.cursor(buffered=False)
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(_FETCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                if count == limit:
+                    more = True
+                    continue
+                record = dict(zip(columns, row))
+                if source.compressed_column in record:
+                    record[source.body_column] = body_codec.decode(
+                        config, record[source.body_column], record[source.compressed_column])
+                item = {name: _json_value(record[name]) for name in fields}
+                yield (', ' if count else '') + json.dumps(item, ensure_ascii=False)
+                last = record
+                count += 1
+        cursor.close()
+    next_cursor = _encode_cursor(last['date'], last['id']) if more else None
+    yield '], "count": %d, "next_cursor": %s}' % (count, json.dumps(next_cursor))
+
+
+# 在 Flask 應用程式上註冊來源資料的列表、單筆查詢、全文搜尋與匯出端點；get_config 回傳目前的資料庫連線設定
+def register_routes(app, source, get_config):
+    from flask import Response, jsonify, request, stream_with_context
+
+    default_fields = ('id', 'title', 'date', 'url')
+
+    def list_items():
+        try:
+            fields = _parse_fields(source, request.args.get('fields'), default_fields)
+            limit = _parse_limit(request.args.get('limit'))
+            cursor = request.args.get('cursor')
+            after = _decode_cursor(cursor) if cursor else None
+            since = _parse_date(request.args['since'], 'since') if request.args.get('since') else None
+            until = _parse_date(request.args['until'], 'until') if request.args.get('until') else None
+        except _BadRequest as err:
+            return jsonify({'error': str(err)}), 400
+
+        config = get_config()
+        columns, query, params = _list_query(source, fields, limit, after, since, until)
+        if limit > READ_API_CACHE_ROWS:
+            stream = _stream_list(config, source, fields, columns, query, params, limit)
+            return Response(stream_with_context(stream), mimetype='application/json')
+
+        key = (storage.config_key(config), query, tuple(str(p) for p in params), tuple(fields))
+        body = result_cache.get(source.table, key)
+        if body is None:
+            generation = result_cache.generation(source.table)
+            try:
+                body = ''.join(_stream_list(config, source, fields, columns, query, params, limit)).encode('utf-8')
+            except storage.DB_ERRORS as err:
+                return jsonify({'error': str(err)}), 503
+            result_cache.put(source.table, key, body, generation)
+        return Response(body, mimetype='application/json')
+
+    def get_item(item_id):
+        try:
+            fields = _parse_fields(source, request.args.get('fields'), ('id',) + source.columns)
+        except _BadRequest as err:
+            return jsonify({'error': str(err)}), 400
+
+        config = get_config()
+        key = (storage.config_key(config), 'item', item_id, tuple(fields))
+        item = result_cache.get(source.table, key)
+        if item is None:
+            generation = result_cache.generation(source.table)
+            columns = list(fields)
+            if source.body_column in fields:
+                columns.append(source.compressed_column)
+            try:
+                if source.compressed_column in columns:
+                    body_codec.preload(config)
+                with storage.connection(config) as cnx:
+                    cursor = cnx.cursor()
+                    cursor.execute(f"SELECT {', '.join(columns)} FROM {source.table} WHERE id = %s",
+                                   (item_id,))
+                    row = cursor.fetchone()
+                    cursor.close()
+                if row is None:
+                    return jsonify({'error': '找不到此筆資料'}), 404
+                record = dict(zip(columns, row))
+                if source.compressed_column in record:
+                    record[source.body_column] = body_codec.decode(
+                        config, record[source.body_column], record[source.compressed_column])
+            except storage.DB_ERRORS as err:
+                return jsonify({'error': str(err)}), 503
+            item = {name: _json_value(record[name]) for name in fields}
+            result_cache.put(source.table, key, item, generation)
+        return jsonify(item)
+
+    def search_items():
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'error': '請提供查詢詞 q'}), 400
+        try:
+            limit = _parse_limit(request.args.get('limit'))
+        except _BadRequest as err:
+            return jsonify({'error': str(err)}), 400
+        try:
+            results = search.search(get_config(), source, query, limit)
+        except storage.DB_ERRORS as err:
+            return jsonify({'error': str(err)}), 503
+        return jsonify({'query': query, 'count': len(results), 'items': results})
+
+    # 整批匯出，回應以串流輸出，記憶體用量與資料量無關。incremental 指定名稱時只匯出該名稱上次匯出之後的資料；
+    # 只有 POST 會在輸出完成後推進匯出位置，GET 可重複讀取（預先載入或重試的 GET 不會讓資料被略過）
+    def export_items():
+        fmt = request.args.get('format', 'jsonl')
+        if fmt not in export.FORMATS:
+            return jsonify({'error': f"format 須為 {', '.join(export.FORMATS)} 之一"}), 400
+        try:
+            fields = _parse_fields(source, request.args.get('fields'), ('id',) + source.columns)
+            since = _parse_date(request.args['since'], 'since') if request.args.get('since') else None
+            until = _parse_date(request.args['until'], 'until') if request.args.get('until') else None
+        except _BadRequest as err:
+            return jsonify({'error': str(err)}), 400
+        data = export.stream(get_config(), source, fmt, fields, since, until, request.args.get('incremental'),
+                             advance=request.method == 'POST')
+        return Response(stream_with_context(data), mimetype=export.MIMETYPES[fmt], headers={
+            'Content-Disposition': f"attachment; filename={source.table}.{fmt}"})
+
+    app.add_url_rule(f"/api/{source.name}", f"list_{source.name}", list_items)
+    app.add_url_rule(f"/api/{source.name}/<int:item_id>", f"get_{source.name}", get_item)
+    app.add_url_rule(f"/api/{source.name}/search", f"search_{source.name}", search_items)
+    app.add_url_rule(f"/api/{source.name}/export", f"export_{source.name}", export_items, methods=['GET', 'POST'])
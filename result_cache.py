@@ -0,0 +1,51 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# 讀取 API 的結果快取：最多保留 RESULT_CACHE_SIZE 筆，每筆存活 RESULT_CACHE_TTL 秒
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', '256'))
+RESULT_CACHE_TTL = float(os.getenv('RESULT_CACHE_TTL', '60'))
+
+_entries = OrderedDict()
+_generations = {}
+_lock = threading.Lock()
+
+
+# 資料表目前的版本號；查詢前先取得，寫入快取時若版本已變（期間有新資料）則不快取
+def generation(table):
+    with _lock:
+        return _generations.get(table, 0)
+
+
+# 爬蟲寫入新資料時呼叫，使該資料表的所有快取失效
+def invalidate(table):
+    with _lock:
+        _generations[table] = _generations.get(table, 0) + 1
+        for key in [key for key in _entries if key[0] == table]:
+            del _entries[key]
+
+
+def get(table, key):
+    with _lock:
+        full_key = (table, _generations.get(table, 0), key)
+        entry = _entries.get(full_key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del _entries[full_key]
+            return None
+        _entries.move_to_end(full_key)
+        return value
+
+
+def put(table, key, value, generation):
+    with _lock:
+        if generation != _generations.get(table, 0):
+            return
+        full_key = (table, generation, key)
+        _entries[full_key] = (time.monotonic() + RESULT_CACHE_TTL, value)
+        _entries.move_to_end(full_key)
+        while len(_entries) > RESULT_CACHE_SIZE:
+            _entries.popitem(last=False)
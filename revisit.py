@@ -0,0 +1,166 @@
+import argparse
+import hashlib
+import os
+import sys
+import unicodedata
+
+import requests
+
+import body_codec
+import crawl_state
+import fetcher
+import http_cache
+import http_client
+import migrate
+import result_cache
+import search
+import sources
+import storage
+
+# 重新檢查已儲存的新聞稿是否在發布後被修改：python revisit.py
+#
+# 每筆資料存有正規化內文的 SHA-256（content_hash）。重新檢查的間隔隨發布天數拉長：
+# 間隔 = 發布天數 × REVISIT_FACTOR，並限制在 REVISIT_MIN_DAYS 與 REVISIT_MAX_DAYS 之間，
+# 因此近期的新聞稿常被檢查，舊的很少被檢查。重新下載時附上 ETag / Last-Modified，伺服器回 304 即不需解析。
+# 只有指紋改變的資料才會改寫，舊版本保存在 <資料表>_revisions。
+REVISIT_FACTOR = float(os.getenv('REVISIT_FACTOR', '0.25'))
+REVISIT_MIN_DAYS = float(os.getenv('REVISIT_MIN_DAYS', '1'))
+REVISIT_MAX_DAYS = float(os.getenv('REVISIT_MAX_DAYS', '180'))
+# 每個來源每次最多重新檢查的筆數
+REVISIT_LIMIT = int(os.getenv('REVISIT_LIMIT', '200'))
+
+
+# 正規化內文：統一全形半形與空白，避免排版差異被當成內容修改
+def normalize(text):
+    return ' '.join(unicodedata.normalize('NFKC', text or '').split())
+
+
+def content_hash(text):
+    return hashlib.sha256(normalize(text).encode('utf-8')).digest()
+
+
+# 找出已到期需重新檢查的資料；尚未計算指紋的舊資料一併取出內文，用來比對
+def due_rows(config, source, limit=REVISIT_LIMIT):
+    if storage.backend_name(config) == 'sqlite':
+        # SQLite 沒有 INTERVAL 與 DATEDIFF，以 julianday 計算相同的間隔
+        due = ("COALESCE(checked_at, date) <= datetime('now', 'localtime', printf('-%d hours', "
+               "ROUND(MIN(MAX(CAST(julianday('now', 'localtime') - julianday(date) AS INTEGER) * %s, %s), %s) * 24)))")
+    else:
+        due = ("COALESCE(checked_at, date) <= NOW() - INTERVAL "
+               "ROUND(LEAST(GREATEST(DATEDIFF(NOW(), date) * %s, %s), %s) * 24) HOUR")
+    query = (f"SELECT id, title, url, content_hash, CASE WHEN content_hash IS NULL THEN {source.body_column} END, "
+             f"CASE WHEN content_hash IS NULL THEN {source.compressed_column} END FROM {source.table} "
+             f"WHERE {due} ORDER BY date DESC, id DESC LIMIT %s")
+    body_codec.preload(config)
+    with storage.connection(config) as cnx:
+        cursor = cnx.cursor()
+        cursor.execute(query, (REVISIT_FACTOR, REVISIT_MIN_DAYS, REVISIT_MAX_DAYS, limit))
+        rows = [row[:4] + (body_codec.decode(config, row[4], row[5]),) for row in cursor.fetchall()]
+        cursor.close()
+    return rows
+
+
+# 寫入檢查結果：未變更的資料只更新檢查時間（並補上指紋），變更的資料先保存舊版本再改寫
+def _save(config, source, unchanged, changed):
+    table = source.table
+    body, compressed = source.body_column, source.compressed_column
+    with storage.connection(config) as cnx:
+        cursor = cnx.cursor()
+        if unchanged:
+            cursor.executemany(f"UPDATE {table} SET checked_at = NOW(), "
+                               "content_hash = COALESCE(content_hash, %s) WHERE id = %s", unchanged)
+        for report_id, text, digest in changed:
+            cursor.execute(f"INSERT INTO {table}_revisions (report_id, title, {body}, {compressed}, content_hash) "
+                           f"SELECT id, title, {body}, {compressed}, content_hash FROM {table} WHERE id = %s",
+                           (report_id,))
+            cursor.execute(f"UPDATE {table} SET {body} = %s, {compressed} = %s, content_hash = %s, "
+                           "checked_at = NOW() WHERE id = %s",
+                           body_codec.encode(config, text) + (digest, report_id))
+        cnx.commit()
+        cursor.close()
+
+
+# 重新檢查一個來源到期的資料，回傳內容有變更的筆數
+def revisit(source, config, log=print, progress=None, limit=REVISIT_LIMIT):
+    migrate.check_schema(config)
+    rows = due_rows(config, source, limit)
+    if not rows:
+        log(f"[{source.name}] 沒有需要重新檢查的資料")
+        return 0
+    state_key = crawl_state.source_key(config, source.table)
+
+    def fetch(url):
+        try:
+            return http_client.get(url, scope=state_key)
+        except requests.RequestException as err:
+            log(f"重新檢查失敗: {url} ({err})")
+            return None
+
+    unchanged = []
+    changed = []
+    updated = []
+    fetched = []
+    responses = fetcher.fetch_all(fetch, [row[2] for row in rows])
+    for (report_id, title, url, stored_hash, stored_body), response in zip(rows, responses):
+        if response is None:
+            continue
+        if response.status_code == 304:
+            unchanged.append((None, report_id))
+            continue
+        if not response.ok:
+            log(f"重新檢查失敗: {url} (HTTP {response.status_code})")
+            continue
+        text = source.extract(response.text)
+        digest = content_hash(text)
+        fetched.append((url, response))
+        if digest == (stored_hash or content_hash(stored_body)):
+            unchanged.append((digest, report_id))
+        else:
+            changed.append((report_id, text, digest))
+            updated.append((title, None, url, text))
+            log(f"內容已更新: {url}")
+
+    _save(config, source, unchanged, changed)
+    # 寫入成功後才記錄驗證資訊並更新快取，失敗時下次會再完整比對
+    for url, response in fetched:
+        http_client.remember(state_key, url, response)
+        http_cache.put(url, response.text)
+    if changed:
+        result_cache.invalidate(source.table)
+        if search.SEARCH_INDEX:
+            search.add(state_key, updated)
+    if progress is not None:
+        progress('revisited', len(unchanged) + len(changed))
+        progress('updated', len(changed))
+    log(f"[{source.name}] 重新檢查 {len(rows)} 筆，{len(changed)} 筆內容已更新")
+    return len(changed)
+
+
+# 依序重新檢查多個來源；各來源的錯誤分別記錄，不影響其他來源
+def revisit_all(config, names=None, log=print, progress=None):
+    errors = {}
+    for name in (names or sources.SOURCES):
+        try:
+            revisit(sources.SOURCES[name], config, log=log, progress=progress)
+        except (*storage.DB_ERRORS, migrate.SchemaError) as err:
+            errors[name] = err
+            log(f"[{name}] 重新檢查失敗: {err}")
+    return errors
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='重新檢查已儲存的新聞稿是否被修改')
+    parser.add_argument('--source', choices=sorted(sources.SOURCES), action='append',
+                        help='只檢查指定來源（預設為全部）')
+    parser.add_argument('--limit', type=int, default=REVISIT_LIMIT, help='每個來源最多檢查的筆數')
+    args = parser.parse_args()
+
+    config = storage.env_config()
+    failed = False
+    for source in [sources.SOURCES[name] for name in (args.source or sources.SOURCES)]:
+        try:
+            revisit(source, config, limit=args.limit)
+        except (*storage.DB_ERRORS, migrate.SchemaError) as err:
+            print(f"Error: {err}")
+            failed = True
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,143 @@
+import os
+import random
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import crawl_state
+
+# 事件驅動的定期排程，取代每秒輪詢 schedule.run_pending() 的迴圈：
+# 排程執行緒睡到最近一個工作的到期時間才醒來，到期的工作交給背景執行緒執行，不會阻擋呼叫端。
+# 同一個工作同時只會有一次在執行；執行時間超過間隔時，結束後只補跑一次，不會累積錯過的次數。
+# 成功執行的時間記錄在爬取狀態檔，重新啟動後接續原本的排程，不會立即重新爬取。
+#
+# 每次的間隔加上 ±SCHEDULE_JITTER 比例的隨機偏移，避免多個來源或多台機器同時對網站發出請求
+SCHEDULE_JITTER = float(os.getenv('SCHEDULE_JITTER', '0.05'))
+SCHEDULE_WORKERS = int(os.getenv('SCHEDULE_WORKERS', '4'))
+# 執行失敗後的重試延遲（秒），連續失敗時每次加倍，最長不超過原本的間隔
+SCHEDULE_RETRY_DELAY = float(os.getenv('SCHEDULE_RETRY_DELAY', '300'))
+
+# 最長睡眠時間：系統休眠或調整時鐘後也能及時重新計算
+_MAX_SLEEP = 3600
+
+
+class _Entry:
+    def __init__(self, name):
+        self.name = name
+        self.interval = None
+        self.func = None
+        self.state_key = None
+        self.running = False
+        self.rerun = False
+        self.failures = 0
+        self.last_run = None
+        self.next_run = None
+
+
+class Scheduler:
+    def __init__(self, jitter=SCHEDULE_JITTER, workers=SCHEDULE_WORKERS, log=print,
+                 retry_delay=SCHEDULE_RETRY_DELAY):
+        self.jitter = jitter
+        self.retry_delay = retry_delay
+        self.log = log
+        self._entries = {}
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='schedule')
+        self._thread = None
+        self._stopped = False
+
+    def _delay(self, interval):
+        return interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    # 新增或更新工作：每 interval 秒執行一次 func。state_key 有值時以此名稱在狀態檔記錄上次執行時間；
+    # 從未執行過的工作在 immediate 為真時立即執行，否則等一個間隔。回傳下次執行的時間
+    def add(self, name, interval, func, state_key=None, immediate=True):
+        last_run = crawl_state.get_last_run(state_key) if state_key else None
+        with self._cond:
+            entry = self._entries.get(name) or _Entry(name)
+            entry.interval, entry.func, entry.state_key = interval, func, state_key
+            entry.last_run = last_run
+            if last_run is not None:
+                entry.next_run = last_run + self._delay(interval)
+            else:
+                entry.next_run = time.time() + (0 if immediate else self._delay(interval))
+            # 執行中的工作在結束後才依新的設定排程；已到期時結束後立即再執行一次
+            entry.rerun = entry.running and entry.next_run <= time.time()
+            self._entries[name] = entry
+            self._cond.notify()
+            return entry.next_run
+
+    # 讓工作立即執行一次；已在執行中時不重複執行，改為結束後再執行一次，回傳 False
+    def run_now(self, name):
+        with self._cond:
+            entry = self._entries[name]
+            if entry.running:
+                entry.rerun = True
+                return False
+            entry.next_run = time.time()
+            self._cond.notify()
+            return True
+
+    def status(self):
+        with self._cond:
+            return [{'name': entry.name, 'running': entry.running, 'last_run': entry.last_run,
+                     'next_run': entry.next_run, 'failures': entry.failures} for entry in self._entries.values()]
+
+    def _loop(self):
+        with self._cond:
+            while not self._stopped:
+                now = time.time()
+                for entry in self._entries.values():
+                    if not entry.running and entry.next_run <= now:
+                        entry.running = True
+                        self._executor.submit(self._run, entry)
+                waiting = [entry.next_run for entry in self._entries.values() if not entry.running]
+                timeout = min(max(min(waiting) - now, 0), _MAX_SLEEP) if waiting else None
+                self._cond.wait(timeout)
+
+    def _run(self, entry):
+        started = time.time()
+        succeeded = False
+        try:
+            entry.func()
+            succeeded = True
+        except Exception as err:
+            self.log(f"[{entry.name}] 排程工作失敗: {err}")
+            traceback.print_exc()
+        if succeeded and entry.state_key:
+            crawl_state.set_last_run(entry.state_key, started)
+        with self._cond:
+            entry.running = False
+            if succeeded:
+                entry.last_run = started
+                entry.failures = 0
+                # 以開始時間計算下次執行，維持固定的節奏；超過間隔的執行結束後會立即補跑一次
+                next_run = started + self._delay(entry.interval)
+            else:
+                # 失敗（例如網站或資料庫暫時無法連線）時不等一整個間隔，依連續失敗次數退避後重試
+                entry.failures += 1
+                retry = min(self.retry_delay * 2 ** min(entry.failures - 1, 16), entry.interval)
+                next_run = time.time() + self._delay(retry)
+                self.log(f"[{entry.name}] 第 {entry.failures} 次失敗，"
+                         f"{time.strftime('%H:%M', time.localtime(next_run))} 重試")
+            entry.next_run = time.time() if entry.rerun else next_run
+            entry.rerun = False
+            self._cond.notify()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='scheduler', daemon=True)
+            self._thread.start()
+
+    # 在目前的執行緒等待排程（供命令列程式使用）
+    def run_forever(self):
+        self.start()
+        while self._thread.is_alive():
+            self._thread.join(_MAX_SLEEP)
+
+    def stop(self, wait=True):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._executor.shutdown(wait=wait)
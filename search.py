@@ -0,0 +1,193 @@
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+import body_codec
+import crawl_state
+import sources
+import storage
+
+# 全文檢索：以 SQLite FTS5 建立中文字元雙字（bigram）的反向索引，依 BM25 排序。
+#
+# 內文會切成重疊的雙字詞，例如「國家人權」→「國家 家人 人權 權」，查詢時再以相同方式切詞並要求
+# 各詞相鄰（片語比對），因此任意長度的詞都能找到，不需要中文斷詞字典。英數字以整個單字為一詞。
+# 爬蟲寫入資料時同步更新索引；既有資料可用 python search.py --rebuild 一次建立。
+#
+#   python search.py 人權 監獄
+#   python search.py --source nhrc --limit 5 酷刑
+SEARCH_INDEX = os.getenv('SEARCH_INDEX', '1') == '1'
+SEARCH_INDEX_PATH = os.getenv('SEARCH_INDEX_PATH', 'search_index.db')
+# 片段在命中位置前後各保留的字數
+SEARCH_SNIPPET_CHARS = int(os.getenv('SEARCH_SNIPPET_CHARS', '60'))
+
+_CJK = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+_TOKEN_RE = re.compile(f"([{_CJK}]+)|([^\\W{_CJK}]+)")
+
+_db = None
+_lock = threading.Lock()
+
+
+def _get_db():
+    global _db
+    if _db is None:
+        _db = sqlite3.connect(SEARCH_INDEX_PATH, timeout=30, check_same_thread=False)
+        _db.executescript(
+            "PRAGMA journal_mode=WAL;"
+            "CREATE TABLE IF NOT EXISTS docs ("
+            " id INTEGER PRIMARY KEY, source TEXT NOT NULL, url_hash BLOB NOT NULL,"
+            " UNIQUE (source, url_hash));"
+            "CREATE VIRTUAL TABLE IF NOT EXISTS fts USING fts5("
+            " title, body, tokenize='unicode61 remove_diacritics 0');")
+    return _db
+
+
+# 將文字切成索引用的詞：中文取重疊的雙字，並在每段結尾補上最後一個字，讓單字查詢也能命中
+def tokenize(text, query=False):
+    tokens = []
+    for cjk, word in _TOKEN_RE.findall(text or ''):
+        if word:
+            tokens.append(word.lower())
+            continue
+        tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+        if not query or len(cjk) == 1:
+            tokens.append(cjk[-1])
+    return tokens
+
+
+# 將查詢字串轉成 FTS5 的比對式：每個查詢詞為一個片語，各詞之間為 AND；單一中文字以前綴比對
+def _match_expression(query):
+    phrases = []
+    for term in query.split():
+        tokens = tokenize(term, query=True)
+        if not tokens:
+            continue
+        if len(tokens) == 1 and len(tokens[0]) == 1 and _TOKEN_RE.fullmatch(tokens[0]).group(1):
+            phrases.append(f'"{tokens[0]}"*')
+        else:
+            phrases.append('"' + ' '.join(tokens) + '"')
+    return ' '.join(phrases)
+
+
+def _index_rows(db, source, rows):
+    for title, url, body in rows:
+        url_hash = storage.url_hash(url)
+        db.execute("INSERT OR IGNORE INTO docs (source, url_hash) VALUES (?, ?)", (source, url_hash))
+        (doc_id,) = db.execute("SELECT id FROM docs WHERE source = ? AND url_hash = ?",
+                               (source, url_hash)).fetchone()
+        db.execute("DELETE FROM fts WHERE rowid = ?", (doc_id,))
+        db.execute("INSERT INTO fts (rowid, title, body) VALUES (?, ?, ?)",
+                   (doc_id, ' '.join(tokenize(title)), ' '.join(tokenize(body))))
+
+
+# 將剛寫入資料庫的資料加入索引；rows 為 (title, date, url, 內文)，網址重複時以新內容取代
+def add(source, rows):
+    with _lock:
+        db = _get_db()
+        _index_rows(db, source, ((row[0], row[2], row[3]) for row in rows))
+        db.commit()
+
+
+# 由資料庫重新建立一個來源的索引
+def rebuild(config, source, log=print):
+    key = crawl_state.source_key(config, source.table)
+    count = 0
+    with _lock:
+        db = _get_db()
+        db.execute("DELETE FROM fts WHERE rowid IN (SELECT id FROM docs WHERE source = ?)", (key,))
+        db.execute("DELETE FROM docs WHERE source = ?", (key,))
+        batch = []
+        columns = ['title', 'url', source.body_column, source.compressed_column]
+        body_codec.preload(config)
+        for title, url, text, blob in storage.iter_rows(config, source.table, columns):
+            batch.append((title, url, body_codec.decode(config, text, blob)))
+            if len(batch) >= 1000:
+                _index_rows(db, key, batch)
+                count += len(batch)
+                batch = []
+        _index_rows(db, key, batch)
+        count += len(batch)
+        db.execute("INSERT INTO fts (fts) VALUES ('optimize')")
+        db.commit()
+    log(f"已建立 {source.table} 的全文索引，共 {count} 筆")
+    return count
+
+
+# 擷取內文中第一個命中查詢詞的段落
+def snippet(text, query):
+    text = text or ''
+    lowered = text.lower()
+    positions = [lowered.find(term.lower()) for term in query.split()]
+    positions = [pos for pos in positions if pos >= 0]
+    pos = min(positions) if positions else 0
+    start = max(0, pos - SEARCH_SNIPPET_CHARS)
+    end = min(len(text), pos + SEARCH_SNIPPET_CHARS)
+    return ('…' if start > 0 else '') + ' '.join(text[start:end].split()) + ('…' if end < len(text) else '')
+
+
+# 搜尋一個來源，依相關程度回傳 [{'id', 'title', 'date', 'url', 'score', 'snippet'}, ...]；
+# 標題命中的權重較內文高
+def search(config, source, query, limit=20):
+    expression = _match_expression(query)
+    if not expression:
+        return []
+    key = crawl_state.source_key(config, source.table)
+    with _lock:
+        hits = _get_db().execute(
+            "SELECT docs.url_hash, bm25(fts, 5.0, 1.0) AS score FROM fts JOIN docs ON docs.id = fts.rowid "
+            "WHERE fts MATCH ? AND docs.source = ? ORDER BY score LIMIT ?",
+            (expression, key, limit)).fetchall()
+    if not hits:
+        return []
+
+    placeholders = ', '.join(['%s'] * len(hits))
+    with storage.connection(config) as cnx:
+        cursor = cnx.cursor()
+        cursor.execute(f"SELECT url_hash, id, title, date, url, {source.body_column}, {source.compressed_column} "
+                       f"FROM {source.table} WHERE url_hash IN ({placeholders})", [url_hash for url_hash, _ in hits])
+        rows = {bytes(row[0]): row[1:] for row in cursor.fetchall()}
+        cursor.close()
+
+    results = []
+    for url_hash, score in hits:
+        row = rows.get(bytes(url_hash))
+        if row is None:
+            continue  # 資料庫中已刪除的資料
+        item_id, title, date, url, text, blob = row
+        body = body_codec.decode(config, text, blob)
+        results.append({'id': item_id, 'title': title, 'date': str(date), 'url': url,
+                        'score': round(-score, 4), 'snippet': snippet(body, query)})
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='搜尋已爬取的新聞稿內文')
+    parser.add_argument('query', nargs='*', help='查詢詞，以空白分隔的多個詞須同時出現')
+    parser.add_argument('--source', choices=sorted(sources.SOURCES), action='append',
+                        help='只搜尋指定來源（預設為全部）')
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--rebuild', action='store_true', help='由資料庫重新建立索引')
+    args = parser.parse_args()
+
+    config = storage.env_config()
+    selected = [sources.SOURCES[name] for name in (args.source or sources.SOURCES)]
+    try:
+        if args.rebuild:
+            for source in selected:
+                rebuild(config, source)
+        if args.query:
+            query = ' '.join(args.query)
+            for source in selected:
+                started = time.perf_counter()
+                results = search(config, source, query, args.limit)
+                print(f"[{source.name}] {len(results)} 筆（{(time.perf_counter() - started) * 1000:.1f} ms）")
+                for item in results:
+                    print(f"  {item['date']} {item['title']}  ({item['score']})")
+                    print(f"    {item['snippet']}")
+                    print(f"    {item['url']}")
+    except storage.DB_ERRORS as err:
+        print(f"Error: {err}")
+        sys.exit(1)
@@ -0,0 +1,111 @@
+import parsing
+
+# 無法解析的日期一律記為此值，增量爬取不會以此日期判斷資料是否已存在
+UNKNOWN_DATE = '1970-01-01'
+
+
+# 檢查並格式化日期
+def parse_date(date_str):
+    try:
+        # 將民國年轉換為西元年
+        year, month, day = map(int, date_str.split('-'))
+        year += 1911
+        date = f"{year}-{month:02d}-{day:02d}"
+        return date
+    except ValueError:
+        return UNKNOWN_DATE  # 如果無法解析日期，使用默認值
+
+
+# 將日期統一為西元年的 YYYY-MM-DD，民國年會加上 1911
+def to_iso_date(date_str):
+    try:
+        year, month, day = map(int, date_str.replace('/', '-').split('-'))
+        if year < 1911:
+            year += 1911
+        return f"{year}-{month:02d}-{day:02d}"
+    except ValueError:
+        return UNKNOWN_DATE  # 如果無法解析日期，使用默認值
+
+
+# 解析監察院新聞稿列表中的一列
+def parse_cy_row(news):
+    date = to_iso_date(news.select_one('span').text.strip())
+    title = news.select_one('a').text.strip()
+    link = news.select_one('a')['href']
+    return title, date, link
+
+
+# 解析人權會新聞稿列表中的一列；日期依序嘗試兩種版面的位置
+def parse_nhrc_row(news):
+    date_span = (news.select_one('div.label > ul > li > span > i.mark')
+                 or news.select_one('li.mark'))
+    date = parse_date(date_span.text.strip()) if date_span else UNKNOWN_DATE
+    caption_div = news.select_one('div.caption')
+    title = caption_div.select_one('span').text.strip() if caption_div else '未知標題'
+    link = news.select_one('a')['href']
+    return title, date, link
+
+
+# 爬取來源的設定：列表網址、列表與內文的選擇器、每列的解析方式與寫入的資料表
+class Source:
+    def __init__(self, name, listing_url, listing_selector, parse_row, link_prefix,
+                 content_selector, table, body_column):
+        self.name = name
+        self.listing_url = listing_url
+        self.listing_selector = listing_selector
+        self.parse_row = parse_row
+        self.link_prefix = link_prefix
+        self.content_selector = content_selector
+        self.table = table
+        self.body_column = body_column
+
+    @property
+    def columns(self):
+        return ('title', 'date', 'url', self.body_column)
+
+    # 壓縮儲存內文的欄位，見 body_codec
+    @property
+    def compressed_column(self):
+        return self.body_column + '_z'
+
+    def listing_urls(self, pages):
+        return (self.listing_url.format(page) for page in range(1, pages + 1))
+
+    # 解析列表頁，回傳 (title, date, url) 清單
+    def parse_listing(self, html):
+        doc = parsing.parse(html, self.listing_selector)
+        candidates = []
+        for news in doc.select(self.listing_selector):
+            title, date, link = self.parse_row(news)
+            candidates.append((title, date, self.link_prefix + link))
+        return candidates
+
+    # 提取內文
+    def extract(self, html_content):
+        content_text = parsing.extract_text(html_content, self.content_selector)
+        return content_text if content_text is not None else 'No content found'
+
+
+CONTROL_YUAN = Source(
+    name='cy',
+    listing_url='https://www.cy.gov.tw/News.aspx?_CSN=129&n=792&page={}&PageSize=100&sms=8912&Create=1',
+    listing_selector='table tbody tr',
+    parse_row=parse_cy_row,
+    link_prefix='https://www.cy.gov.tw/',
+    content_selector='div[class="area-essay page-caption-p"]',
+    table='control_yuan_reports',
+    body_column='content',
+)
+
+NHRC = Source(
+    name='nhrc',
+    listing_url='https://nhrc.cy.gov.tw/News4.aspx?n=9772&sms=12362&_CSN=1&page={}&PageSize=20',
+    listing_selector='div.area-essay.message',
+    parse_row=parse_nhrc_row,
+    link_prefix='https://nhrc.cy.gov.tw/',
+    content_selector='div.area-essay',
+    table='human_rights_statements',
+    body_column='statement',
+)
+
+SOURCES = {source.name: source for source in (CONTROL_YUAN, NHRC)}
@@ -0,0 +1,253 @@
+import argparse
+import datetime
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import body_codec
+import sources
+import storage
+
+# 嵌入式 SQLite 儲存後端，不需 MySQL 伺服器即可在本機爬取與測試：
+#   DB_BACKEND=sqlite SQLITE_PATH=local.db python crawler.py
+# 或在連線設定中指定 {'backend': 'sqlite', 'path': 'local.db'}。
+#
+# 資料庫以 WAL 模式開啟，讀取不會被寫入阻擋；每批資料在同一個交易中以 executemany 寫入，
+# 語句由 sqlite3 的快取重複使用（預先編譯）。去除重複的方式與 MySQL 相同：url_hash 為 UNIQUE，
+# 網址重複時以 ON CONFLICT 更新既有資料。資料表在第一次連線時依目前的結構建立，不需執行 migrate.py。
+#
+# 與 MySQL 之間搬移資料（目的端的資料表須已建立）：
+#   python sqlite_store.py --path local.db --to-mysql      # 將本機資料匯入 MySQL
+#   python sqlite_store.py --path local.db --from-mysql    # 將 MySQL 的資料複製到本機
+SQLITE_BUSY_TIMEOUT = float(os.getenv('SQLITE_BUSY_TIMEOUT', '30'))
+
+# 單一查詢的參數數量上限（舊版 SQLite 為 999）
+_MAX_PARAMS = 900
+
+
+def _convert_date(value):
+    return datetime.date.fromisoformat(value.decode('ascii')[:10])
+
+
+# DATE 欄位讀出時轉為 datetime.date，與 MySQL 連線的結果一致
+sqlite3.register_converter('DATE', _convert_date)
+sqlite3.register_adapter(datetime.date, lambda value: value.isoformat())
+sqlite3.register_adapter(datetime.datetime, lambda value: value.isoformat(' ', 'seconds'))
+
+
+def _now():
+    return time.strftime('%Y-%m-%d %H:%M:%S')
+
+
+# 與 migrate.py 各版本套用後相同的結構
+def _create_tables(cnx):
+    cnx.execute("CREATE TABLE IF NOT EXISTS body_dictionaries ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " algorithm TEXT NOT NULL,"
+                " data BLOB NOT NULL,"
+                " created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP)")
+    for source in sources.SOURCES.values():
+        table, body, compressed = source.table, source.body_column, source.compressed_column
+        cnx.execute(f"CREATE TABLE IF NOT EXISTS {table} ("
+                    " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                    " title TEXT NOT NULL,"
+                    " date DATE NOT NULL,"
+                    " url TEXT NOT NULL,"
+                    " url_hash BLOB NOT NULL UNIQUE,"
+                    f" {body} TEXT,"
+                    f" {compressed} BLOB,"
+                    " content_hash BLOB,"
+                    " checked_at TEXT)")
+        cnx.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_date_id ON {table} (date, id)")
+        cnx.execute(f"CREATE TABLE IF NOT EXISTS {table}_revisions ("
+                    " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                    " report_id INTEGER NOT NULL,"
+                    " title TEXT NOT NULL,"
+                    f" {body} TEXT,"
+                    f" {compressed} BLOB,"
+                    " content_hash BLOB,"
+                    " replaced_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP)")
+        cnx.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_revisions_report_id "
+                    f"ON {table}_revisions (report_id)")
+    cnx.commit()
+
+
+# 讓以 MySQL 參數格式（%s）撰寫的查詢可直接在 SQLite 連線上執行
+class _Cursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, params=()):
+        self._cursor.execute(query.replace('%s', '?'), params)
+
+    def executemany(self, query, rows):
+        self._cursor.executemany(query.replace('%s', '?'), rows)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size):
+        return self._cursor.fetchmany(size)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+
+class _Connection:
+    def __init__(self, cnx):
+        self._cnx = cnx
+
+    # buffered 參數只為了與 MySQL 連線的介面相容；SQLite 的游標本來就是逐筆讀取
+    def cursor(self, buffered=None):
+        return _Cursor(self._cnx.cursor())
+
+    def commit(self):
+        self._cnx.commit()
+
+    def rollback(self):
+        self._cnx.rollback()
+
+
+class SqliteBackend:
+    def __init__(self):
+        self._idle = {}
+        self._ready = set()
+        self._lock = threading.Lock()
+
+    def _open(self, path):
+        cnx = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT, detect_types=sqlite3.PARSE_DECLTYPES,
+                              check_same_thread=False, cached_statements=256)
+        cnx.execute("PRAGMA journal_mode=WAL")
+        cnx.execute("PRAGMA synchronous=NORMAL")  # WAL 模式下只在檢查點時 fsync
+        cnx.create_function('NOW', 0, _now)
+        with self._lock:
+            ready = path in self._ready
+        if not ready:
+            _create_tables(cnx)
+            with self._lock:
+                self._ready.add(path)
+        return cnx
+
+    # 與 MySQL 連線池相同：同一執行緒巢狀借用時拿到不同的連線，歸還時撤銷未 commit 的變更
+    @contextmanager
+    def _borrow(self, config):
+        path = storage.sqlite_path(config)
+        with self._lock:
+            idle = self._idle.setdefault(path, [])
+            cnx = idle.pop() if idle else None
+        if cnx is None:
+            cnx = self._open(path)
+        try:
+            yield cnx
+        finally:
+            if cnx.in_transaction:
+                cnx.rollback()
+            with self._lock:
+                idle = self._idle.setdefault(path, [])
+                keep = len(idle) < storage.DB_POOL_SIZE
+                if keep:
+                    idle.append(cnx)
+            if not keep:
+                cnx.close()
+
+    @contextmanager
+    def connection(self, config):
+        with self._borrow(config) as cnx:
+            yield _Connection(cnx)
+
+    def existing_urls(self, config, table, urls):
+        found = set()
+        with self._borrow(config) as cnx:
+            for start in range(0, len(urls), _MAX_PARAMS):
+                chunk = urls[start:start + _MAX_PARAMS]
+                placeholders = ', '.join(['?'] * len(chunk))
+                found.update(url for (url,) in cnx.execute(
+                    f"SELECT url FROM {table} WHERE url_hash IN ({placeholders})",
+                    [storage.url_hash(url) for url in chunk]))
+        return found
+
+    # 整批在同一個交易中寫入，網址重複時更新既有資料（與 MySQL 的 ON DUPLICATE KEY UPDATE 相同）
+    def upsert_rows(self, config, table, columns, rows):
+        names = list(columns) + ['url_hash']
+        url_pos = list(columns).index('url')
+        updates = ', '.join(f"{name} = excluded.{name}" for name in columns if name != 'url')
+        query = (f"INSERT INTO {table} ({', '.join(names)}) "
+                 f"VALUES ({', '.join(['?'] * len(names))}) "
+                 f"ON CONFLICT (url_hash) DO UPDATE SET {updates}")
+        with self._borrow(config) as cnx, cnx:
+            cnx.executemany(query, [tuple(row) + (storage.url_hash(row[url_pos]),) for row in rows])
+        return len(rows)
+
+    def iter_rows(self, config, table, columns, batch_size=10000):
+        with self._borrow(config) as cnx:
+            cursor = cnx.execute(f"SELECT {', '.join(columns)} FROM {table}")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+            cursor.close()
+
+    def close(self):
+        with self._lock:
+            connections = [cnx for idle in self._idle.values() for cnx in idle]
+            self._idle.clear()
+        for cnx in connections:
+            cnx.close()
+
+
+# 將一個來源的資料從 src 複製到 dst，內文依目的端的設定重新編碼（壓縮字典各資料庫不同）；
+# 網址已存在的資料會被更新，可重複執行
+def copy_source(src, dst, source, batch_size=1000, log=print):
+    columns = ['title', 'date', 'url', source.body_column, source.compressed_column, 'content_hash']
+    target_columns = source.columns + ('content_hash', source.compressed_column)
+    batch = []
+    copied = 0
+    body_codec.preload(src)
+    for title, date, url, text, blob, digest in storage.iter_rows(src, source.table, columns, batch_size):
+        text, new_blob = body_codec.encode(dst, body_codec.decode(src, text, blob))
+        batch.append((title, date, url, text, digest, new_blob))
+        if len(batch) >= batch_size:
+            copied += storage.upsert_rows(dst, source.table, target_columns, batch)
+            batch = []
+            log(f"[{source.name}] 已複製 {copied} 筆")
+    copied += storage.upsert_rows(dst, source.table, target_columns, batch)
+    log(f"[{source.name}] 共複製 {copied} 筆")
+    return copied
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='SQLite 與 MySQL 之間的資料搬移')
+    direction = parser.add_mutually_exclusive_group(required=True)
+    direction.add_argument('--to-mysql', action='store_true', help='將 SQLite 的資料匯入 MySQL')
+    direction.add_argument('--from-mysql', action='store_true', help='將 MySQL 的資料複製到 SQLite')
+    parser.add_argument('--path', default=storage.SQLITE_PATH, help='SQLite 資料庫檔案')
+    parser.add_argument('--source', choices=sorted(sources.SOURCES), action='append',
+                        help='只搬移指定來源（預設為全部）')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    mysql_config = dict(storage.env_config(), backend='mysql')
+    sqlite_config = {'backend': 'sqlite', 'path': args.path}
+    src, dst = (sqlite_config, mysql_config) if args.to_mysql else (mysql_config, sqlite_config)
+    try:
+        for name in (args.source or sources.SOURCES):
+            copy_source(src, dst, sources.SOURCES[name], args.batch_size)
+    except (*storage.DB_ERRORS, ImportError, ValueError) as err:
+        print(f"Error: {err}")
+        sys.exit(1)
+    print("目的端的搜尋索引需以 python search.py --rebuild 重新建立")
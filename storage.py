@@ -0,0 +1,264 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import mysql.connector
+
+import metrics
+
+# 連線池大小與同時保留的連線池數量
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_POOLS = int(os.getenv('DB_MAX_POOLS', '4'))
+# 連線池滿時等待歸還的秒數，逾時丟出 PoolError（屬於 DB_ERRORS），不會無限期等待
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+# 連線設定未指定 'backend' 時使用的儲存後端：mysql（預設）或 sqlite
+DB_BACKEND = os.getenv('DB_BACKEND', 'mysql')
+# sqlite 後端的資料庫檔案，連線設定中的 'path' 優先
+SQLITE_PATH = os.getenv('SQLITE_PATH', 'policy_tracker.db')
+
+# 各後端可能丟出的資料庫錯誤，供呼叫端統一捕捉
+DB_ERRORS = (mysql.connector.Error, sqlite3.Error)
+
+_db_seconds = metrics.histogram('db_operation_seconds', '資料庫操作耗時', ('operation',))
+
+_pools = OrderedDict()
+_backends = {}
+_pools_lock = threading.Lock()
+
+
+# 由環境變數 DB_USER、DB_PASSWORD、DB_HOST、DB_NAME 產生的連線設定，命令列工具與查詢 API 共用同一份，
+# 相同的資料庫得到相同的 config_key（共用連線池與快取）
+def env_config():
+    return {
+        'user': os.getenv('DB_USER', 'root'),
+        'password': os.getenv('DB_PASSWORD', ''),
+        'host': os.getenv('DB_HOST', 'localhost'),
+        'database': os.getenv('DB_NAME', 'policy_tracker'),
+    }
+
+
+# 以連線設定產生連線池的鍵值，相同設定共用同一個連線池
+def config_key(config):
+    return tuple(sorted((k, str(v)) for k, v in config.items()))
+
+
+# MySQL 連線池：連線在第一次借用時才建立，建立連線時不持有任何鎖（mysql.connector 內建的連線池
+# 在建構時以全域鎖逐一連線，連線緩慢時會阻擋所有連線池的借用）；閒置連線的管理方式與 sqlite_store 相同
+class _Pool:
+    def __init__(self, config, size):
+        self.config = {k: v for k, v in config.items() if k != 'backend'}
+        # 連線池滿時讓呼叫端等待（最多 DB_POOL_TIMEOUT 秒），而不是直接丟出錯誤
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        self.idle = []
+        self.closed = False
+
+    def get_connection(self):
+        if not self.slots.acquire(timeout=DB_POOL_TIMEOUT):
+            raise mysql.connector.errors.PoolError(f"等待資料庫連線逾時（{DB_POOL_TIMEOUT:g} 秒），連線池已滿")
+        try:
+            with self.lock:
+                cnx = self.idle.pop() if self.idle else None
+            if cnx is None:
+                return mysql.connector.connect(**self.config)
+            # 健康檢查：取出時先 ping，斷線的連線會自動重連
+            cnx.ping(reconnect=True)
+            return cnx
+        except Exception:
+            self.slots.release()
+            raise
+
+    # 歸還連線：重設工作階段（撤銷未 commit 的交易）後放回閒置清單；
+    # 連線池已被淘汰或重設失敗時直接關閉連線，不會遺留在已移除的連線池中
+    def release(self, cnx):
+        try:
+            with self.lock:
+                keep = not self.closed
+            if keep:
+                try:
+                    cnx.reset_session()
+                except mysql.connector.Error:
+                    keep = False
+            if keep:
+                with self.lock:
+                    keep = not self.closed
+                    if keep:
+                        self.idle.append(cnx)
+            if not keep:
+                cnx.close()
+        finally:
+            self.slots.release()
+
+    # 關閉閒置的連線；借出中的連線於歸還時關閉
+    def close(self):
+        with self.lock:
+            self.closed = True
+            idle, self.idle = self.idle, []
+        for cnx in idle:
+            cnx.close()
+
+
+# 取得（或建立）對應連線設定的連線池；建立連線池不會連線，連線在借用時於鎖外建立
+def get_pool(config):
+    key = config_key(config)
+    evicted = []
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is not None:
+            _pools.move_to_end(key)
+            return pool
+        pool = _pools[key] = _Pool(config, DB_POOL_SIZE)
+        # 超過上限時淘汰最久未使用的連線池，避免每次請求的設定造成連線洩漏
+        while len(_pools) > DB_MAX_POOLS:
+            evicted.append(_pools.popitem(last=False)[1])
+    for old in evicted:
+        old.close()
+    return pool
+
+
+# 從連線池借出一條連線，離開 with 區塊時自動歸還；
+# 其他後端的連線提供相同的 cursor()/commit() 介面，查詢一樣以 %s 作為參數佔位符
+@contextmanager
+def connection(config):
+    backend = _backend(config)
+    if backend is not None:
+        with backend.connection(config) as cnx:
+            yield cnx
+        return
+    pool = get_pool(config)
+    cnx = pool.get_connection()
+    try:
+        yield cnx
+    finally:
+        pool.release(cnx)
+
+
+# 關閉所有連線池
+def close_all():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+        backends = list(_backends.values())
+    for pool in pools:
+        pool.close()
+    for backend in backends:
+        if hasattr(backend, 'close'):
+            backend.close()
+
+
+# 註冊 MySQL 以外的儲存後端；連線設定中的 'backend' 指定後端名稱時，
+# existing_urls、upsert_rows、iter_rows 與 connection 改由該後端的同名方法處理（例如基準測試用的記憶體資料庫）
+def register_backend(name, backend):
+    _backends[name] = backend
+
+
+def backend_name(config):
+    return config.get('backend') or DB_BACKEND
+
+
+def _backend(config):
+    name = backend_name(config)
+    if name == 'mysql':
+        return None
+    with _pools_lock:
+        if name == 'sqlite' and name not in _backends:
+            import sqlite_store
+            _backends[name] = sqlite_store.SqliteBackend()
+        try:
+            return _backends[name]
+        except KeyError:
+            raise ValueError(f"未知的儲存後端: {name}")
+
+
+# sqlite 後端使用的資料庫檔案
+def sqlite_path(config):
+    return config.get('path') or SQLITE_PATH
+
+
+# 網址的 SHA-256，對應資料表中有 UNIQUE 索引的 url_hash 欄位
+def url_hash(url):
+    return hashlib.sha256(url.encode('utf-8')).digest()
+
+
+# 以一次查詢找出候選網址中已存在的網址
+def existing_urls(config, table, urls):
+    urls = list(set(urls))
+    if not urls:
+        return set()
+    backend = _backend(config)
+    if backend is not None:
+        with _db_seconds.time(operation='existing_urls'):
+            return backend.existing_urls(config, table, urls)
+    placeholders = ', '.join(['%s'] * len(urls))
+    query = (f"SELECT url FROM {table} "
+             f"WHERE url_hash IN ({placeholders})")
+    with _db_seconds.time(operation='existing_urls'), connection(config) as cnx:
+        cursor = cnx.cursor()
+        cursor.execute(query, [url_hash(url) for url in urls])
+        found = {url for (url,) in cursor.fetchall()}
+        cursor.close()
+    return found
+
+
+# MySQL 8.0.19 起可用列別名引用新值；8.0.20 起 VALUES() 已棄用並產生警告 1287，
+# 連線設定有 raise_on_warnings 時整批寫入會因此失敗。MariaDB 與較舊的 MySQL 不支援列別名，仍使用 VALUES()
+def _supports_row_alias(cnx):
+    if 'mariadb' in (cnx.get_server_info() or '').lower():
+        return False
+    return (cnx.get_server_version() or (0,)) >= (8, 0, 19)
+
+
+def _upsert_query(table, columns, row_alias):
+    names = list(columns) + ['url_hash']
+    query = (f"INSERT INTO {table} ({', '.join(names)}) "
+             f"VALUES ({', '.join(['%s'] * len(names))}) ")
+    if row_alias:
+        updates = ', '.join(f"{name} = new.{name}" for name in columns if name != 'url')
+        return query + f"AS new ON DUPLICATE KEY UPDATE {updates}"
+    updates = ', '.join(f"{name} = VALUES({name})" for name in columns if name != 'url')
+    return query + f"ON DUPLICATE KEY UPDATE {updates}"
+
+
+# 以 INSERT ... ON DUPLICATE KEY UPDATE 一次寫入多筆資料，只 commit 一次；
+# 網址重複時更新既有資料，不需要事先檢查是否存在
+def upsert_rows(config, table, columns, rows):
+    if not rows:
+        return 0
+    backend = _backend(config)
+    if backend is not None:
+        with _db_seconds.time(operation='upsert_rows'):
+            return backend.upsert_rows(config, table, columns, rows)
+    url_pos = list(columns).index('url')
+    with _db_seconds.time(operation='upsert_rows'), connection(config) as cnx:
+        add_data = _upsert_query(table, columns, _supports_row_alias(cnx))
+        cursor = cnx.cursor()
+        cursor.executemany(add_data, [tuple(row) + (url_hash(row[url_pos]),) for row in rows])
+        cnx.commit()
+        cursor.close()
+    return len(rows)
+
+
+# 以不緩衝的游標分批讀出資料表中的指定欄位，避免一次載入整張表
+def iter_rows(config, table, columns, batch_size=10000):
+    backend = _backend(config)
+    if backend is not None:
+        yield from backend.iter_rows(config, table, columns, batch_size)
+        return
+    with connection(config) as cnx:
+        cursor = cnx.cursor(buffered=False)
+        cursor.execute(f"SELECT {', '.join(columns)} FROM {table}")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+        cursor.close()
+
+
+# 分批讀出資料表中所有網址
+def iter_urls(config, table, batch_size=10000):
+    for (url,) in iter_rows(config, table, ['url'], batch_size):
+        yield url
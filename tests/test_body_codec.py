@@ -0,0 +1,46 @@
+from contextlib import contextmanager
+
+import pytest
+
+import body_codec
+import migrate
+import storage
+
+TEXT = '行政院會今日通過「行政院組織法」修正草案，並函請立法院審議。'
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    config = {'backend': 'sqlite', 'path': str(tmp_path / 'policy_tracker.db')}
+    migrate.migrate(config, log=lambda message: None)
+    with storage.connection(config) as cnx:
+        cursor = cnx.cursor()
+        cursor.execute("INSERT INTO body_dictionaries (algorithm, data) VALUES (%s, %s)",
+                       ('zlib', '行政院組織法修正草案立法院審議'.encode('utf-8')))
+        cnx.commit()
+        cursor.close()
+    monkeypatch.setattr(body_codec, '_dictionaries', {})
+    monkeypatch.setattr(body_codec, '_current', {})
+    return config
+
+
+# 在持有連線時解壓縮不可再借用第二條連線（連線池用盡時會互相等待）：預先載入後不再連線
+def test_decode_after_preload_does_not_borrow_a_connection(config, monkeypatch):
+    blob = body_codec.compress(config, TEXT, 'zlib')
+    assert int.from_bytes(blob[1:5], 'big') != 0
+    monkeypatch.setattr(body_codec, '_dictionaries', {})
+    monkeypatch.setattr(body_codec, '_current', {})
+    body_codec.preload(config)
+
+    @contextmanager
+    def connection(config):
+        raise AssertionError('解壓縮時不應再借用連線')
+        yield
+
+    monkeypatch.setattr(storage, 'connection', connection)
+    assert body_codec.decode(config, None, blob) == TEXT
+    assert body_codec.compress(config, TEXT, 'zlib') == blob
+
+
+def test_decode_uncompressed_text(config):
+    assert body_codec.decode(config, TEXT, None) == TEXT
@@ -0,0 +1,200 @@
+import random
+import threading
+import time
+
+import pytest
+
+import pipeline
+
+
+# 在背景執行緒執行管線並限制等待時間，管線卡住時測試會失敗而不是一直等待
+def _run(pipe, timeout=10):
+    errors = []
+
+    def run():
+        try:
+            pipe.run()
+        except Exception as err:
+            errors.append(err)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), '管線未在時限內結束'
+    return errors
+
+
+def _jittered(func):
+    def wrapper(item):
+        time.sleep(random.uniform(0, 0.005))
+        return func(item)
+    return wrapper
+
+
+def test_sink_receives_items_in_order_with_multiple_workers():
+    out = []
+    stages = [pipeline.Stage('double', _jittered(lambda x: x * 2), workers=4, queue_size=5),
+              pipeline.Stage('inc', _jittered(lambda x: x + 1), workers=3, queue_size=5)]
+    pipe = pipeline.Pipeline('order', lambda pipe: iter(range(200)), stages, out.append)
+    assert _run(pipe) == []
+    assert out == [x * 2 + 1 for x in range(200)]
+    assert pipe.produced == 200
+    assert [stat['processed'] for stat in pipe.stats()] == [200, 200]
+
+
+def test_markers_pass_through_stages_in_order():
+    def produce(pipe):
+        for page in range(3):
+            yield from (page * 10 + n for n in range(5))
+            yield pipeline.Marker(page)
+
+    out = []
+    stage = pipeline.Stage('square', _jittered(lambda x: x * x), workers=3)
+    pipe = pipeline.Pipeline('markers', produce, [stage], out.append)
+    assert _run(pipe) == []
+    expected = []
+    for page in range(3):
+        expected += [(page * 10 + n) ** 2 for n in range(5)] + [page]
+    assert [item.value if isinstance(item, pipeline.Marker) else item for item in out] == expected
+    assert stage.processed == 15
+
+
+def test_batch_stage_receives_lists_and_keeps_order():
+    batches = []
+
+    def square_batch(items):
+        batches.append(list(items))
+        return [x * x for x in items]
+
+    out = []
+    stage = pipeline.Stage('square', square_batch, workers=2, batch_size=8)
+    pipe = pipeline.Pipeline('batch', lambda pipe: iter(range(100)), [stage], out.append)
+    assert _run(pipe) == []
+    assert out == [x * x for x in range(100)]
+    assert all(1 <= len(batch) <= 8 for batch in batches)
+    assert sorted(x for batch in batches for x in batch) == list(range(100))
+
+
+# 批次中的標記不會送進批次函式，仍依原本的位置傳給寫入端
+def test_batch_stage_skips_markers():
+    def produce(pipe):
+        yield from (1, 2, pipeline.Marker('page'), 3)
+
+    def double_batch(items):
+        assert not any(isinstance(item, pipeline.Marker) for item in items)
+        return [x * 2 for x in items]
+
+    out = []
+    pipe = pipeline.Pipeline('batch-markers', produce,
+                             [pipeline.Stage('double', double_batch, batch_size=10)], out.append)
+    assert _run(pipe) == []
+    assert [item.value if isinstance(item, pipeline.Marker) else item for item in out] == [2, 4, 'page', 6]
+
+
+def test_flush_called_once_after_sink():
+    events = []
+    pipe = pipeline.Pipeline('flush', lambda pipe: iter(range(3)), [pipeline.Stage('id', lambda x: x)],
+                             lambda item: events.append(item), flush=lambda: events.append('flush'))
+    assert _run(pipe) == []
+    assert events == [0, 1, 2, 'flush']
+
+
+def test_no_stages_sends_items_directly_to_sink():
+    out = []
+    pipe = pipeline.Pipeline('direct', lambda pipe: iter('abc'), [], out.append)
+    assert _run(pipe) == []
+    assert out == ['a', 'b', 'c']
+
+
+# 階段發生例外時，失敗項目之後的資料都不會寫入，例外於 run() 結束時拋出
+def test_stage_error_drops_later_items_and_is_raised():
+    def check(x):
+        if x == 5:
+            raise ValueError('bad item')
+        return x
+
+    out = []
+    flushed = []
+    pipe = pipeline.Pipeline('error', lambda pipe: iter(range(50)), [pipeline.Stage('check', check, workers=3)],
+                             out.append, flush=lambda: flushed.append(True))
+    errors = _run(pipe)
+    assert len(errors) == 1 and isinstance(errors[0], ValueError)
+    assert out == list(range(5))
+    assert pipe.cancelled
+    assert flushed == [True]
+
+
+def test_producer_error_is_raised():
+    def produce(pipe):
+        yield 1
+        raise RuntimeError('listing failed')
+
+    out = []
+    pipe = pipeline.Pipeline('producer-error', produce, [pipeline.Stage('id', lambda x: x)], out.append)
+    errors = _run(pipe)
+    assert len(errors) == 1 and isinstance(errors[0], RuntimeError)
+    assert pipe.cancelled
+
+
+def test_sink_error_drops_later_items():
+    out = []
+
+    def sink(item):
+        if item == 3:
+            raise ValueError('write failed')
+        out.append(item)
+
+    pipe = pipeline.Pipeline('sink-error', lambda pipe: iter(range(20)), [pipeline.Stage('id', lambda x: x)], sink)
+    errors = _run(pipe)
+    assert len(errors) == 1 and isinstance(errors[0], ValueError)
+    assert out == [0, 1, 2]
+
+
+# 階段呼叫 cancel() 後，上游停止產生項目，尚未處理的項目以 _DROPPED 傳遞，之後的資料都不會寫入
+def test_cancel_stops_producer_and_drops_pending_items():
+    produced = []
+
+    def produce(pipe):
+        for n in range(10000):
+            produced.append(n)
+            yield n
+
+    def check(x):
+        if x == 10:
+            pipe.cancel()
+        return x
+
+    out = []
+    pipe = pipeline.Pipeline('cancel', produce, [pipeline.Stage('check', check, workers=2, queue_size=4)],
+                             out.append)
+    assert _run(pipe) == []
+    assert pipe.cancelled and pipe.error is None
+    assert len(produced) < 10000
+    assert out == list(range(len(out)))
+    assert len(out) <= 12  # 取消時另一個執行緒可能正在處理下一筆
+
+
+def test_listeners_observe_stage_and_sink_times():
+    calls = []
+
+    def listener(pipe_name, stage_name, seconds, count):
+        calls.append((pipe_name, stage_name, count))
+
+    pipeline.add_listener(listener)
+    try:
+        pipe = pipeline.Pipeline('observed', lambda pipe: iter(range(4)), [pipeline.Stage('id', lambda x: x)],
+                                 lambda item: None)
+        assert _run(pipe) == []
+    finally:
+        pipeline.remove_listener(listener)
+    assert calls.count(('observed', 'id', 1)) == 4
+    assert calls.count(('observed', 'sink', 1)) == 4
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_empty_producer(workers):
+    out = []
+    pipe = pipeline.Pipeline('empty', lambda pipe: iter(()), [pipeline.Stage('id', lambda x: x, workers=workers)],
+                             out.append)
+    assert _run(pipe) == []
+    assert out == [] and pipe.produced == 0
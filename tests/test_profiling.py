@@ -0,0 +1,76 @@
+import os
+import threading
+
+import pytest
+
+import pipeline
+import profiling
+
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, 'CRAWL_PROFILE_DIR', str(tmp_path))
+    monkeypatch.setattr(profiling, 'CRAWL_PROFILE', '')
+    monkeypatch.setattr(profiling, '_once', None)
+    return tmp_path
+
+
+# 在背景執行緒執行管線並限制等待時間，分析讓工作執行緒結束時測試會失敗而不是卡住
+def _run_pipeline(count=50):
+    out = []
+    pipe = pipeline.Pipeline('profiled', lambda pipe: iter(range(count)),
+                             [pipeline.Stage('square', lambda x: x * x, workers=3)], out.append)
+    errors = []
+
+    def run():
+        try:
+            pipe.run()
+        except Exception as err:
+            errors.append(err)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(10)
+    assert not thread.is_alive(), '管線沒有在時間內結束'
+    assert errors == []
+    return out
+
+
+@pytest.mark.parametrize('mode, suffixes', [
+    ('cprofile', ['.pstats']),
+    ('sample', ['.collapsed']),
+    ('all', ['.collapsed', '.pstats']),
+])
+def test_pipeline_runs_inside_profile(profile_dir, mode, suffixes):
+    profiling.request_once(mode)
+    logs = []
+    with profiling.profile('crawl', log=logs.append):
+        out = _run_pipeline()
+    assert out == [n * n for n in range(50)]
+    files = sorted(os.listdir(profile_dir))
+    assert [os.path.splitext(name)[1] for name in files] == suffixes
+    assert len(logs) == 1
+
+
+def test_nested_profile_keeps_single_request(profile_dir):
+    profiling.request_once('cprofile')
+    logs = []
+    with profiling.profile('outer', log=logs.append):
+        with profiling.profile('inner', log=logs.append):
+            pass
+    assert len(logs) == 1 and 'outer' in logs[0]
+    assert profiling._once is None
+
+
+def test_request_waits_while_another_profile_is_active(profile_dir):
+    profiling.request_once('sample')
+    with profiling._active:
+        with profiling.profile('busy', log=print):
+            pass
+    assert profiling._once == ('sample', False)
+
+
+def test_profile_is_noop_without_request(profile_dir):
+    with profiling.profile('idle'):
+        pass
+    assert os.listdir(profile_dir) == []
@@ -0,0 +1,145 @@
+import threading
+import time
+
+import pytest
+
+import crawl_state
+import scheduler
+
+
+@pytest.fixture(autouse=True)
+def state_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(crawl_state, 'CRAWL_STATE_PATH', str(tmp_path / 'crawl_state.json'))
+
+
+@pytest.fixture
+def sched():
+    messages = []
+    sched = scheduler.Scheduler(jitter=0, workers=2, log=messages.append, retry_delay=0.05)
+    sched.messages = messages
+    yield sched
+    sched.stop(wait=False)
+
+
+def _wait_until(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+# 同一個工作同時只會有一次在執行；執行中再要求執行時，結束後只補跑一次
+def test_one_run_in_flight_and_single_rerun(sched):
+    started = []
+    release = threading.Event()
+    active = []
+    overlaps = []
+
+    def job():
+        if active:
+            overlaps.append(True)
+        active.append(True)
+        started.append(time.time())
+        release.wait(5)
+        active.pop()
+
+    sched.add('job', 3600, job)
+    sched.start()
+    assert _wait_until(lambda: len(started) == 1)
+    assert sched.run_now('job') is False
+    assert sched.run_now('job') is False
+    release.set()
+    assert _wait_until(lambda: len(started) == 2)
+    time.sleep(0.2)
+    assert len(started) == 2
+    assert overlaps == []
+    assert _wait_until(lambda: not sched.status()[0]['running'])
+    assert sched.run_now('job') is True
+    assert _wait_until(lambda: len(started) == 3)
+
+
+# 執行時間超過間隔時，結束後立即補跑一次，不會累積錯過的次數
+def test_overrun_runs_once_after_finishing(sched):
+    runs = []
+
+    def job():
+        runs.append(time.time())
+        if len(runs) == 1:
+            time.sleep(0.3)
+
+    sched.add('slow', 0.05, job)
+    sched.start()
+    assert _wait_until(lambda: len(runs) >= 2)
+    assert runs[1] - runs[0] < 0.4
+
+
+def test_immediate_false_waits_one_interval(sched):
+    runs = []
+    added = time.time()
+    sched.add('later', 0.3, lambda: runs.append(time.time()), immediate=False)
+    sched.start()
+    assert _wait_until(lambda: runs)
+    assert runs[0] - added >= 0.3
+
+
+# 連續失敗時重試延遲每次加倍，成功後歸零
+def test_failures_back_off_and_reset_on_success(sched):
+    calls = []
+
+    def job():
+        calls.append(time.time())
+        if len(calls) <= 3:
+            raise RuntimeError('site unavailable')
+
+    sched.add('flaky', 3600, job)
+    sched.start()
+    assert _wait_until(lambda: len(calls) == 4)
+    gaps = [b - a for a, b in zip(calls, calls[1:])]
+    assert gaps[0] >= 0.05
+    assert gaps[1] >= 0.1
+    assert gaps[2] >= 0.2
+    assert _wait_until(lambda: sched.status()[0]['failures'] == 0 and not sched.status()[0]['running'])
+    assert any('第 3 次失敗' in message for message in sched.messages)
+
+
+def test_retry_delay_is_capped_at_interval():
+    calls = []
+
+    def job():
+        calls.append(time.time())
+        raise RuntimeError('database unavailable')
+
+    sched = scheduler.Scheduler(jitter=0, log=lambda message: None, retry_delay=3600)
+    try:
+        sched.add('capped', 0.1, job)
+        sched.start()
+        assert _wait_until(lambda: len(calls) >= 2)
+        assert sched.status()[0]['failures'] >= 1
+    finally:
+        sched.stop(wait=False)
+
+
+# 成功執行的時間記錄在狀態檔，重新啟動後依上次執行時間排程，不會立即再執行；失敗不會記錄
+def test_last_run_persists_across_restarts(sched):
+    runs = []
+    sched.add('persisted', 3600, lambda: runs.append(time.time()), state_key='test:persisted')
+    sched.start()
+    assert _wait_until(lambda: crawl_state.get_last_run('test:persisted') is not None)
+    last_run = crawl_state.get_last_run('test:persisted')
+    assert abs(last_run - runs[0]) < 1
+
+    restarted = scheduler.Scheduler(jitter=0, log=lambda message: None)
+    try:
+        next_run = restarted.add('persisted', 3600, lambda: runs.append(time.time()), state_key='test:persisted')
+        assert next_run == pytest.approx(last_run + 3600)
+    finally:
+        restarted.stop(wait=False)
+
+    def fail():
+        raise RuntimeError('boom')
+
+    sched.add('failing', 3600, fail, state_key='test:failing')
+    assert _wait_until(lambda: sched.status()[1]['failures'] == 1)
+    assert crawl_state.get_last_run('test:failing') is None
@@ -0,0 +1,99 @@
+from contextlib import contextmanager
+
+import mysql.connector
+import pytest
+
+import storage
+
+# 以假的連線檢查 upsert_rows 產生的語句；連線設定有 raise_on_warnings 時，
+# 模擬 MySQL 8.0.20 以後對 VALUES() 產生的棄用警告 1287 並丟出錯誤（與 mysql.connector 的行為相同）
+CONFIG = {'backend': 'mysql', 'user': 'root', 'password': '', 'host': 'db', 'database': 'policy_tracker',
+          'raise_on_warnings': True}
+COLUMNS = ('title', 'date', 'url', 'statement')
+
+
+class _Cursor:
+    def __init__(self, cnx):
+        self.cnx = cnx
+
+    def executemany(self, query, rows):
+        if self.cnx.config.get('raise_on_warnings') and 'VALUES(' in query and self.cnx.deprecates_values:
+            raise mysql.connector.errors.DatabaseError(
+                msg="'VALUES function' is deprecated and will be removed in a future release.", errno=1287)
+        self.cnx.executed.append((query, rows))
+
+    def close(self):
+        pass
+
+
+class _Connection:
+    def __init__(self, config, server_info, server_version):
+        self.config = config
+        self.server_info = server_info
+        self.server_version = server_version
+        self.deprecates_values = 'MariaDB' not in server_info and server_version >= (8, 0, 20)
+        self.executed = []
+        self.committed = False
+
+    def get_server_info(self):
+        return self.server_info
+
+    def get_server_version(self):
+        return self.server_version
+
+    def cursor(self):
+        return _Cursor(self)
+
+    def commit(self):
+        self.committed = True
+
+
+def _fake_server(monkeypatch, server_info, server_version):
+    connections = []
+
+    @contextmanager
+    def connection(config):
+        cnx = _Connection(config, server_info, server_version)
+        connections.append(cnx)
+        yield cnx
+
+    monkeypatch.setattr(storage, 'connection', connection)
+    return connections
+
+
+def test_upsert_uses_row_alias_on_mysql_8(monkeypatch):
+    connections = _fake_server(monkeypatch, '8.0.36', (8, 0, 36))
+    rows = [('標題', '2024-05-01', 'https://www.cy.gov.tw/a', '內文')]
+    assert storage.upsert_rows(CONFIG, 'reports', COLUMNS, rows) == 1
+    (query, written), = connections[0].executed
+    assert 'VALUES(' not in query
+    assert 'AS new ON DUPLICATE KEY UPDATE title = new.title, date = new.date, statement = new.statement' in query
+    assert written == [rows[0] + (storage.url_hash(rows[0][2]),)]
+    assert connections[0].committed
+
+
+@pytest.mark.parametrize('server_info, server_version', [
+    ('5.7.44-log', (5, 7, 44)),
+    ('10.11.6-MariaDB', (10, 11, 6)),
+])
+def test_upsert_falls_back_to_values_without_row_alias(monkeypatch, server_info, server_version):
+    connections = _fake_server(monkeypatch, server_info, server_version)
+    storage.upsert_rows(CONFIG, 'reports', COLUMNS, [('t', '2024-05-01', 'u', 'b')])
+    (query, _), = connections[0].executed
+    assert 'AS new' not in query
+    assert 'title = VALUES(title)' in query
+
+
+def test_upsert_without_rows_does_not_connect(monkeypatch):
+    connections = _fake_server(monkeypatch, '8.0.36', (8, 0, 36))
+    assert storage.upsert_rows(CONFIG, 'reports', COLUMNS, []) == 0
+    assert connections == []
+
+
+def test_pool_wait_times_out_with_db_error(monkeypatch):
+    monkeypatch.setattr(storage, 'DB_POOL_TIMEOUT', 0.05)
+    monkeypatch.setattr(mysql.connector, 'connect', lambda **config: object())
+    pool = storage._Pool(CONFIG, 1)
+    pool.get_connection()
+    with pytest.raises(storage.DB_ERRORS):
+        pool.get_connection()
@@ -0,0 +1,77 @@
+import storage
+import url_index
+
+URLS = [f'https://www.ey.gov.tw/Page/9277F759E41CCD91/{n:06d}' for n in range(2000)]
+
+
+def test_loaded_urls_are_found():
+    index = url_index.UrlIndex(url_index.url_key(url) for url in URLS)
+    assert len(index) == len(URLS)
+    assert all(url in index for url in URLS)
+
+
+def test_unknown_urls_are_not_found():
+    index = url_index.UrlIndex(url_index.url_key(url) for url in URLS[:1000])
+    assert not any(url in index for url in URLS[1000:])
+
+
+def test_added_urls_are_found():
+    index = url_index.UrlIndex()
+    assert URLS[0] not in index
+    index.add(URLS[0])
+    assert URLS[0] in index
+    assert len(index) == 1
+
+
+# 新增的網址超過門檻時併入排序陣列，超過容量時重建 Bloom filter，原有與新增的網址都仍查得到
+def test_merge_and_bloom_rebuild_keep_all_urls(monkeypatch):
+    monkeypatch.setattr(url_index, '_MERGE_THRESHOLD', 100)
+    index = url_index.UrlIndex(url_index.url_key(url) for url in URLS[:10])
+    capacity = index._bloom.capacity
+    for url in URLS[10:1500]:
+        index.add(url)
+    assert len(index._recent) <= 100
+    assert index._bloom.capacity > capacity
+    assert len(index) == 1500
+    assert all(url in index for url in URLS[:1500])
+    assert not any(url in index for url in URLS[1500:])
+
+
+def test_adding_a_known_url_is_idempotent(monkeypatch):
+    monkeypatch.setattr(url_index, '_MERGE_THRESHOLD', 10)
+    index = url_index.UrlIndex(url_index.url_key(url) for url in URLS[:20])
+    for url in URLS[:20]:
+        index.add(url)
+    assert len(index._sorted) == 20
+
+
+# Bloom filter 不會漏判，誤判率接近設定值
+def test_bloom_filter_false_positive_rate():
+    bloom = url_index.BloomFilter(10000, fp_rate=0.01)
+    keys = [url_index.url_key(url) for url in URLS]
+    for key in keys[:1000]:
+        bloom.add(key)
+    assert all(key in bloom for key in keys[:1000])
+    others = [url_index.url_key(f'https://example.com/{n}') for n in range(20000)]
+    assert sum(key in bloom for key in others) / len(others) < 0.02
+
+
+def test_get_index_loads_once_and_returns_none_on_db_error(monkeypatch):
+    loads = []
+
+    def iter_urls(config, table):
+        loads.append(table)
+        if table == 'broken':
+            raise storage.DB_ERRORS[0]('connection refused')
+        return iter(URLS[:5])
+
+    monkeypatch.setattr(storage, 'iter_urls', iter_urls)
+    monkeypatch.setattr(url_index, '_indexes', {})
+    config = {'backend': 'mysql', 'database': 'policy_tracker'}
+    messages = []
+    index = url_index.get_index(config, 'ey_news', messages.append)
+    assert URLS[0] in index and URLS[5] not in index
+    assert url_index.get_index(config, 'ey_news', messages.append) is index
+    assert url_index.get_index(config, 'broken', messages.append) is None
+    assert loads == ['ey_news', 'broken']
+    assert any('connection refused' in message for message in messages)
@@ -0,0 +1,110 @@
+import hashlib
+import math
+import os
+import threading
+from array import array
+from bisect import bisect_left
+
+import storage
+
+# 啟動時將已儲存的網址載入記憶體，列表中已在索引內的資料不必查詢資料庫。
+# 索引只會得知本行程寫入的網址，其他行程（例如另一個伺服器或 crawler.py）寫入的資料要查詢資料庫後才會加入，
+# 因此索引判定「不存在」的網址仍須由呼叫端向資料庫確認。
+#
+# 記憶體用量（以一百萬筆為例）：
+#   - Bloom filter：誤判率 1%、預留兩倍容量時每筆約 19 bits，約 2.4 MB
+#   - 精確比對用的 64-bit 雜湊排序陣列：每筆 8 bytes，約 8 MB
+#   - 載入時排序會暫時產生 Python int 清單，尖峰約再多 40 MB，載入完成即釋放
+# Bloom filter 判定不存在的網址直接視為新資料；判定可能存在時再以二分搜尋精確比對。
+URL_INDEX = os.getenv('URL_INDEX', '1') == '1'
+URL_INDEX_FP_RATE = float(os.getenv('URL_INDEX_FP_RATE', '0.01'))
+
+# 執行期間新增的網址先放在集合中，超過此數量再併入排序陣列
+_MERGE_THRESHOLD = 10000
+_MASK = (1 << 64) - 1
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+# 網址的 64-bit 雜湊
+def url_key(url):
+    return int.from_bytes(hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class BloomFilter:
+    def __init__(self, capacity, fp_rate=URL_INDEX_FP_RATE):
+        self.capacity = max(capacity, 1024)
+        self.size = int(-self.capacity * math.log(fp_rate) / (math.log(2) ** 2)) + 1
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    # 以雙重雜湊由 64-bit 鍵產生 k 個位置，第二段雜湊以 splitmix64 混合取得
+    def _positions(self, key):
+        h2 = (key ^ (key >> 31)) * 0xbf58476d1ce4e5b9 & _MASK
+        h2 = (h2 ^ (h2 >> 27)) * 0x94d049bb133111eb & _MASK | 1
+        return ((key + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+# 已儲存網址的成員索引：Bloom filter 加上排序後的 64-bit 雜湊陣列
+class UrlIndex:
+    def __init__(self, keys=()):
+        self._sorted = array('Q', sorted(keys))
+        self._recent = set()
+        self._lock = threading.Lock()
+        self._bloom = self._build_bloom()
+
+    def _build_bloom(self):
+        bloom = BloomFilter(len(self) * 2)
+        for key in self._sorted:
+            bloom.add(key)
+        for key in self._recent:
+            bloom.add(key)
+        return bloom
+
+    def __len__(self):
+        return len(self._sorted) + len(self._recent)
+
+    def __contains__(self, url):
+        key = url_key(url)
+        if key not in self._bloom:
+            return False
+        if key in self._recent:
+            return True
+        i = bisect_left(self._sorted, key)
+        return i < len(self._sorted) and self._sorted[i] == key
+
+    def add(self, url):
+        key = url_key(url)
+        with self._lock:
+            self._recent.add(key)
+            self._bloom.add(key)
+            if len(self._recent) > _MERGE_THRESHOLD:
+                self._sorted = array('Q', sorted(set(self._sorted) | self._recent))
+                self._recent = set()
+            # 超過容量時以兩倍大小重建 Bloom filter，維持誤判率
+            if len(self) > self._bloom.capacity:
+                self._bloom = self._build_bloom()
+
+
+# 取得資料表的網址索引，第一次使用時由資料庫載入；載入失敗時回傳 None，由呼叫端改查資料庫
+def get_index(config, table, log=print):
+    key = (storage.config_key(config), table)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            try:
+                index = UrlIndex(url_key(url) for url in storage.iter_urls(config, table))
+            except storage.DB_ERRORS as err:
+                log(f"Error: {err}")
+                return None
+            _indexes[key] = index
+            log(f"已載入 {table} 的網址索引，共 {len(index)} 筆")
+        return index